@@ -0,0 +1,10 @@
+'''
+fsnd_auth
+Auth0 bearer token verification shared by BasicFlaskAuth and the
+coffee shop backend
+'''
+from .core import (AuthError, TokenVerifier, check_permissions,
+                   get_token_auth_header, granted_permissions)
+from .jwks import JWKSCache, JWKSFetchError
+from .permissions import GrantedPermissions, PermissionRequirement
+from .token_cache import TokenCache
@@ -0,0 +1,188 @@
+from flask import request
+from jose import jwt
+
+from .jwks import JWKSCache
+from .permissions import GrantedPermissions, PermissionRequirement
+from .token_cache import TokenCache
+
+'''
+AuthError Exception
+A standardized way to communicate auth failure modes
+'''
+
+
+class AuthError(Exception):
+    def __init__(self, error, status_code):
+        self.error = error
+        self.status_code = status_code
+
+
+'''
+get_token_auth_header()
+    returns the bearer token from the Authorization header of the
+    current request
+    raises an AuthError if the header is missing or malformed
+'''
+
+
+def get_token_auth_header():
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    token = parts[1]
+    return token
+
+
+'''
+granted_permissions(payload)
+    returns the GrantedPermissions of a decoded payload
+    or None if the payload has no permissions claim
+'''
+
+
+def granted_permissions(payload):
+    if 'permissions' not in payload:
+        return None
+    return GrantedPermissions(payload['permissions'])
+
+
+'''
+check_permissions(permission, payload, granted=None)
+    permission: string permission (i.e. 'post:drink')
+        or a compiled PermissionRequirement
+    payload: decoded jwt payload
+    granted: the GrantedPermissions of the payload, built from
+        payload['permissions'] when not given
+    raises an AuthError if the payload has no permissions claim
+    or does not satisfy the requirement, returns True otherwise
+'''
+
+
+def check_permissions(permission, payload, granted=None):
+    if granted is None:
+        granted = granted_permissions(payload)
+
+    if granted is None:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    requirement = PermissionRequirement.compile(permission)
+    if not requirement.is_satisfied_by(granted):
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+    return True
+
+
+'''
+TokenVerifier
+verifies Auth0 access tokens for one tenant and API audience
+    signing keys come from `jwks` (a JWKSCache on the tenant's
+    /.well-known/jwks.json by default) and verified tokens are
+    remembered in `token_cache` until they expire
+    EXAMPLE
+        verifier = TokenVerifier('example.auth0.com', 'shop')
+        verifier.jwks.start()
+        payload, granted = verifier.get_verified_token(token)
+'''
+
+
+class TokenVerifier:
+    def __init__(self, domain, audience, algorithms=('RS256',),
+                 jwks=None, token_cache=None):
+        self.domain = domain
+        self.audience = audience
+        self.algorithms = list(algorithms)
+        self.issuer = 'https://' + domain + '/'
+        if jwks is None:
+            jwks = JWKSCache(self.issuer + '.well-known/jwks.json')
+        self.jwks = jwks
+        if token_cache is None:
+            token_cache = TokenCache()
+        self.token_cache = token_cache
+
+    '''
+    verify_decode_jwt(token)
+        checks the signature and claims of `token` and returns its
+        decoded payload, raises an AuthError otherwise
+    '''
+    def verify_decode_jwt(self, token):
+        unverified_header = jwt.get_unverified_header(token)
+        if 'kid' not in unverified_header:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Authorization malformed.'
+            }, 401)
+
+        rsa_key = self.jwks.get_key(unverified_header['kid'])
+        if not rsa_key:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to find the appropriate key.'
+            }, 400)
+
+        try:
+            return jwt.decode(
+                token,
+                rsa_key,
+                algorithms=self.algorithms,
+                audience=self.audience,
+                issuer=self.issuer
+            )
+
+        except jwt.ExpiredSignatureError:
+            raise AuthError({
+                'code': 'token_expired',
+                'description': 'Token expired.'
+            }, 401)
+
+        except jwt.JWTClaimsError:
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Incorrect claims. Please, ' +
+                'check the audience and issuer.'
+            }, 401)
+        except Exception:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to parse authentication token.'
+            }, 400)
+
+    '''
+    get_verified_token(token)
+        returns (payload, granted) for `token`, from token_cache when it
+        was verified before, so repeat tokens skip the signature check
+    '''
+    def get_verified_token(self, token):
+        entry = self.token_cache.get(token)
+        if entry is None:
+            payload = self.verify_decode_jwt(token)
+            entry = (payload, granted_permissions(payload))
+            self.token_cache.put(token, entry, payload.get('exp'))
+        return entry
@@ -0,0 +1,254 @@
+import json
+import threading
+import time
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+'''
+JWKSFetchError
+raised when the identity provider answers with something other than
+a key set
+'''
+
+
+class JWKSFetchError(Exception):
+    pass
+
+
+'''
+JWKSCache
+a process-wide cache of the signing keys published at a JWKS url
+    keys are indexed by their key id (kid) and kept for `ttl` seconds
+    an unknown kid triggers one refetch, at most once every
+    `min_refresh_interval` seconds, so key rotation keeps working
+    without letting bogus tokens hammer the identity provider
+    the url may be an http(s):// or file:// url, or a plain path to a
+    local jwks.json file
+    http(s) fetches give up after `connect_timeout` seconds when
+    connecting and `read_timeout` seconds between reads
+
+    stale_while_revalidate=True keeps serving the last good key set
+    once it is older than `ttl`, or when a refetch fails, and refreshes
+    it from a background thread instead of the request thread; an
+    unknown kid then fails the current request while the refetch runs
+    start() prefetches the key set and keeps it fresh from a daemon
+    thread, so request threads never wait on the identity provider
+    EXAMPLE
+        cache = JWKSCache('https://example.auth0.com/.well-known/jwks.json',
+                          stale_while_revalidate=True)
+        cache.start()
+        rsa_key = cache.get_key(unverified_header['kid'])
+'''
+
+
+class JWKSCache:
+    def __init__(self, url, ttl=600, min_refresh_interval=30,
+                 connect_timeout=3, read_timeout=5,
+                 stale_while_revalidate=False, clock=time.monotonic):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.stale_while_revalidate = stale_while_revalidate
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.last_error = None
+
+        self._keys = {}
+        self._fetched_at = None
+        self._last_refresh = None
+        self._lock = threading.Lock()
+
+        self._refreshing = False
+        self._refreshing_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    '''
+    get_key(kid)
+        returns the rsa key for `kid`, or None if the provider
+        does not publish it
+    '''
+    def get_key(self, kid):
+        now = self.clock()
+        if self._fetched_at is None or now - self._fetched_at >= self.ttl:
+            self._revalidate()
+
+        key = self._keys.get(kid)
+        if key is not None:
+            self.hits += 1
+            return key
+
+        self.misses += 1
+        if self._refresh_allowed(self.clock()):
+            self._revalidate()
+            key = self._keys.get(kid)
+        return key
+
+    '''
+    refresh()
+        fetches the key set and replaces the cached keys
+        the previous keys are kept if the fetch fails
+    '''
+    def refresh(self):
+        requested_at = self.clock()
+        with self._lock:
+            # another thread refreshed while we waited for the lock
+            if (self._fetched_at is not None and
+                    self._fetched_at > requested_at):
+                return
+
+            self._last_refresh = self.clock()
+            try:
+                jwks = self._fetch()
+                keys = self._parse(jwks)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+                raise
+            self._keys = keys
+            self._fetched_at = self.clock()
+            self.refreshes += 1
+
+    '''
+    refresh_async()
+        refreshes from a background thread, at most one at a time
+        returns the thread, or None if a refresh is already running
+    '''
+    def refresh_async(self):
+        with self._refreshing_lock:
+            if self._refreshing:
+                return None
+            self._refreshing = True
+
+        thread = threading.Thread(target=self._refresh_in_background,
+                                  name='jwks-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    '''
+    start(interval)
+        prefetches the key set and refreshes it every `interval`
+        seconds (half the ttl by default) from a daemon thread
+    '''
+    def start(self, interval=None):
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        if interval is None:
+            interval = self.ttl / 2
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name='jwks-prefetch', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    '''
+    clear()
+        drops every cached key so the next lookup refetches
+    '''
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_refresh = None
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+            'keys': len(self._keys)
+        }
+
+    def _revalidate(self):
+        if self.stale_while_revalidate and self._keys:
+            if self._refresh_allowed(self.clock()):
+                self.refresh_async()
+        else:
+            self.refresh()
+
+    def _refresh_allowed(self, now):
+        return (self._last_refresh is None or
+                now - self._last_refresh >= self.min_refresh_interval)
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            # counted in refresh(), the last good keys stay in use
+            pass
+        finally:
+            with self._refreshing_lock:
+                self._refreshing = False
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                pass
+            self._stop.wait(interval)
+
+    def _fetch(self):
+        if '://' not in self.url:
+            with open(self.url) as f:
+                return json.load(f)
+
+        parts = urlsplit(self.url)
+        if parts.scheme not in ('http', 'https'):
+            with urlopen(self.url, timeout=self.read_timeout) as response:
+                return json.loads(response.read())
+
+        connection_class = (HTTPSConnection if parts.scheme == 'https'
+                            else HTTPConnection)
+        connection = connection_class(parts.hostname, parts.port,
+                                      timeout=self.connect_timeout)
+        try:
+            connection.connect()
+            connection.sock.settimeout(self.read_timeout)
+
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            connection.request('GET', path,
+                               headers={'Accept': 'application/json'})
+            response = connection.getresponse()
+            body = response.read()
+            if response.status != 200:
+                raise JWKSFetchError('{} returned HTTP {}'.format(
+                    self.url, response.status))
+            return json.loads(body)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _parse(jwks):
+        if not isinstance(jwks, dict) or 'keys' not in jwks:
+            raise JWKSFetchError('response is not a JWK set')
+
+        keys = {}
+        for key in jwks['keys']:
+            if key.get('kty') != 'RSA' or 'kid' not in key:
+                continue
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key.get('use'),
+                'n': key['n'],
+                'e': key['e']
+            }
+        return keys
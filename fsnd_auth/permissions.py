@@ -0,0 +1,158 @@
+'''
+Permission matching for requires_auth
+
+Permissions are colon separated verb:resource scopes such as
+'get:drinks-detail' or 'patch:drinks'. A '*' segment is a wildcard for
+one segment, or for every remaining segment when it is the last one:
+    '*'          every permission
+    'get:*'      every 'get:...' permission
+    '*:drinks'   every verb on drinks: 'get:drinks', 'patch:drinks', ...
+A token granted a wildcard holds every permission it matches, and a
+route requiring a wildcard accepts any token holding some permission it
+matches (or a wildcard covering it).
+
+Both sides are compiled once: routes compile their requirement when they
+are decorated, and each verified token is compiled into a
+GrantedPermissions when it is verified, so a request for a literal
+scope only does set lookups.
+'''
+import itertools
+
+WILDCARD = '*'
+
+
+def _segments(scope):
+    return tuple(scope.split(':'))
+
+
+def _matches(pattern, segments):
+
+    # whether the segments of `pattern` match `segments`, a '*' matches
+    # one segment, or one or more when it is the last one
+
+    last = len(pattern) - 1
+    for i, part in enumerate(pattern):
+        if part == WILDCARD and i == last:
+            return len(segments) > i
+        if i >= len(segments) or part not in (WILDCARD, segments[i]):
+            return False
+    return len(pattern) == len(segments)
+
+
+def _covering(segments):
+
+    # every wildcard scope that matches the literal scope `segments`:
+    # each segment kept or replaced by '*', either in full or cut after
+    # a '*' that then stands for the rest
+
+    patterns = set()
+    for masked in itertools.product(*[(part, WILDCARD) for part in
+                                      segments]):
+        for end in range(1, len(masked) + 1):
+            pattern = masked[:end]
+            if pattern[-1] == WILDCARD or (end == len(masked) and
+                                           WILDCARD in pattern):
+                patterns.add(':'.join(pattern))
+    return frozenset(patterns)
+
+
+'''
+GrantedPermissions
+the permissions carried by one verified token
+    exact: frozenset of the literal scopes in the token
+    wildcards: frozenset of the wildcard scopes in the token
+    exact_segments, wildcard_segments: the same scopes split into
+    segments, used to answer wildcard requirements
+'''
+
+
+class GrantedPermissions:
+    __slots__ = ('exact', 'wildcards', 'exact_segments', 'wildcard_segments')
+
+    def __init__(self, permissions):
+        permissions = frozenset(permissions)
+        self.wildcards = frozenset(p for p in permissions
+                                   if WILDCARD in _segments(p))
+        self.exact = permissions - self.wildcards
+        self.exact_segments = tuple(_segments(p) for p in self.exact)
+        self.wildcard_segments = tuple(_segments(p) for p in self.wildcards)
+
+    def __repr__(self):
+        return 'GrantedPermissions({!r})'.format(
+            sorted(self.exact) + sorted(self.wildcards))
+
+
+'''
+_CompiledScope
+one required scope with the lookups it needs precomputed
+    covering: for a literal scope, every wildcard grant that holds it
+'''
+
+
+class _CompiledScope:
+    __slots__ = ('scope', 'segments', 'wildcard', 'covering')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.segments = _segments(scope)
+        self.wildcard = WILDCARD in self.segments
+        self.covering = frozenset() if self.wildcard else _covering(
+            self.segments)
+
+    def held_by(self, granted):
+        if not self.wildcard:
+            return (self.scope in granted.exact or
+                    not self.covering.isdisjoint(granted.wildcards))
+
+        for segments in granted.exact_segments:
+            if _matches(self.segments, segments):
+                return True
+        # a granted wildcard covers the required one when it matches it
+        # with the required '*' segments read literally
+        for pattern in granted.wildcard_segments:
+            if _matches(pattern, self.segments):
+                return True
+        return False
+
+
+'''
+PermissionRequirement
+what a route needs from a token
+    all_of: every one of these scopes must be held
+    any_of: at least one of these scopes must be held (ignored if empty)
+    EXAMPLE
+        requirement = PermissionRequirement(all_of=['get:drinks-detail'])
+        requirement.is_satisfied_by(GrantedPermissions(payload['permissions']))
+'''
+
+
+class PermissionRequirement:
+    def __init__(self, all_of=(), any_of=()):
+        self.all_of = tuple(_CompiledScope(s) for s in
+                            sorted(frozenset(all_of)))
+        self.any_of = tuple(_CompiledScope(s) for s in
+                            sorted(frozenset(any_of)))
+
+    @classmethod
+    def compile(cls, permission='', all_of=None, any_of=None):
+        if isinstance(permission, cls):
+            return permission
+        required = set(all_of or ())
+        if permission:
+            required.add(permission)
+        return cls(all_of=required, any_of=any_of or ())
+
+    def is_satisfied_by(self, granted):
+        for scope in self.all_of:
+            if not scope.held_by(granted):
+                return False
+        if self.any_of:
+            for scope in self.any_of:
+                if scope.held_by(granted):
+                    return True
+            return False
+        return True
+
+    def __repr__(self):
+        return 'PermissionRequirement(all_of={!r}, any_of={!r})'.format(
+            [s.scope for s in self.all_of], [s.scope for s in self.any_of])
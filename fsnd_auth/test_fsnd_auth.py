@@ -0,0 +1,294 @@
+import threading
+import unittest
+
+from fsnd_auth import (AuthError, GrantedPermissions, JWKSCache,
+                       JWKSFetchError, PermissionRequirement, TokenCache,
+                       TokenVerifier, check_permissions)
+
+
+def jwk_set(*kids):
+    return {'keys': [{'kty': 'RSA', 'kid': kid, 'use': 'sig',
+                      'n': 'n-' + kid, 'e': 'AQAB'} for kid in kids]}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeJWKSCache(JWKSCache):
+    '''
+    a JWKSCache serving `jwks` instead of fetching a url
+        fetches: number of times the key set was fetched
+        gate: when set, fetches wait until it is opened
+        jwks=None makes the fetch fail
+    '''
+
+    def __init__(self, jwks, **kwargs):
+        super().__init__('https://example.auth0.com/.well-known/jwks.json',
+                         **kwargs)
+        self.jwks = jwks
+        self.fetches = 0
+        self.gate = None
+
+    def _fetch(self):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.fetches += 1
+        if self.jwks is None:
+            raise JWKSFetchError('identity provider is down')
+        return self.jwks
+
+
+def join_refresh_threads():
+    for thread in threading.enumerate():
+        if thread.name == 'jwks-refresh':
+            thread.join(5)
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the JWKSCache test case"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_keys_cached_until_ttl(self):
+        cache = FakeJWKSCache(jwk_set('a'), ttl=600, clock=self.clock)
+
+        first = cache.get_key('a')
+        self.clock.now += 599
+        second = cache.get_key('a')
+        fetches_within_ttl = cache.fetches
+        self.clock.now += 1
+        cache.get_key('a')
+
+        self.assertEqual(first['kid'], 'a')
+        self.assertIs(first, second)
+        self.assertEqual(fetches_within_ttl, 1)
+        self.assertEqual(cache.fetches, 2)
+
+    def test_unknown_kid_refetch_rate_limited(self):
+        cache = FakeJWKSCache(jwk_set('a'), ttl=600, min_refresh_interval=30,
+                              clock=self.clock)
+        cache.get_key('a')
+
+        # the provider rotates to 'b', bogus kids must not hammer it
+        cache.jwks = jwk_set('a', 'b')
+        self.clock.now += 10
+        too_soon = cache.get_key('b')
+        bogus = cache.get_key('bogus')
+        fetches_before_interval = cache.fetches
+        self.clock.now += 20
+        rotated = cache.get_key('b')
+        bogus_again = cache.get_key('bogus')
+
+        self.assertIsNone(too_soon)
+        self.assertIsNone(bogus)
+        self.assertEqual(fetches_before_interval, 1)
+        self.assertEqual(rotated['kid'], 'b')
+        self.assertIsNone(bogus_again)
+        self.assertEqual(cache.fetches, 2)
+        self.assertEqual(cache.stats()['misses'], 4)
+
+    def test_stale_while_revalidate_serves_last_keys(self):
+        cache = FakeJWKSCache(jwk_set('a'), ttl=600, min_refresh_interval=30,
+                              stale_while_revalidate=True, clock=self.clock)
+        cache.get_key('a')
+
+        # the key set is stale and the refetch is slow: requests keep
+        # being served from the stale keys meanwhile
+        cache.jwks = jwk_set('b')
+        cache.gate = threading.Event()
+        self.clock.now += 600
+        stale = cache.get_key('a')
+        cache.gate.set()
+        join_refresh_threads()
+        fresh = cache.get_key('b')
+
+        self.assertEqual(stale['kid'], 'a')
+        self.assertEqual(fresh['kid'], 'b')
+        self.assertEqual(cache.fetches, 2)
+
+    def test_stale_while_revalidate_keeps_keys_on_error(self):
+        cache = FakeJWKSCache(jwk_set('a'), ttl=600,
+                              stale_while_revalidate=True, clock=self.clock)
+        cache.get_key('a')
+
+        cache.jwks = None
+        self.clock.now += 600
+        cache.get_key('a')
+        join_refresh_threads()
+        key = cache.get_key('a')
+
+        self.assertEqual(key['kid'], 'a')
+        self.assertEqual(cache.errors, 1)
+        self.assertIsInstance(cache.last_error, JWKSFetchError)
+
+    def test_fetch_error_without_stale_keys(self):
+        cache = FakeJWKSCache(None, stale_while_revalidate=True,
+                              clock=self.clock)
+
+        with self.assertRaises(JWKSFetchError):
+            cache.get_key('a')
+
+
+class CountingVerifier(TokenVerifier):
+    # a TokenVerifier whose signature check returns `payload` and counts calls
+
+    def __init__(self, payload, token_cache):
+        super().__init__('example.auth0.com', 'shop',
+                         jwks=FakeJWKSCache(jwk_set('a')),
+                         token_cache=token_cache)
+        self.payload = payload
+        self.verifications = 0
+
+    def verify_decode_jwt(self, token):
+        self.verifications += 1
+        return self.payload
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the TokenCache test case"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_entry_expires_at_token_exp(self):
+        cache = TokenCache(clock=self.clock)
+        cache.put('token', 'payload', self.clock.now + 60)
+
+        self.clock.now += 59
+        before_exp = cache.get('token')
+        self.clock.now += 1
+        at_exp = cache.get('token')
+
+        self.assertEqual(before_exp, 'payload')
+        self.assertIsNone(at_exp)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 0})
+
+    def test_entry_without_exp_not_cached(self):
+        cache = TokenCache(clock=self.clock)
+        cache.put('token', 'payload', None)
+
+        self.assertIsNone(cache.get('token'))
+
+    def test_least_recently_used_evicted(self):
+        cache = TokenCache(maxsize=2, clock=self.clock)
+        expires_at = self.clock.now + 60
+        cache.put('first', 1, expires_at)
+        cache.put('second', 2, expires_at)
+        cache.get('first')
+        cache.put('third', 3, expires_at)
+
+        self.assertEqual(cache.get('first'), 1)
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.get('third'), 3)
+
+    def test_raw_token_not_kept(self):
+        cache = TokenCache(clock=self.clock)
+        cache.put('secret-token', 'payload', self.clock.now + 60)
+
+        self.assertNotIn('secret-token', cache._entries)
+        self.assertIn(TokenCache.key_for('secret-token'), cache._entries)
+
+    def test_verifier_checks_token_once_until_exp(self):
+        cache = TokenCache(clock=self.clock)
+        verifier = CountingVerifier({'exp': self.clock.now + 60,
+                                     'permissions': ['get:drinks-detail']},
+                                    cache)
+
+        payload, granted = verifier.get_verified_token('token')
+        verifier.get_verified_token('token')
+        verifications_before_exp = verifier.verifications
+        self.clock.now += 60
+        verifier.get_verified_token('token')
+
+        self.assertEqual(payload['permissions'], ['get:drinks-detail'])
+        self.assertIn('get:drinks-detail', granted.exact)
+        self.assertEqual(verifications_before_exp, 1)
+        self.assertEqual(verifier.verifications, 2)
+
+
+def holds(permissions, **requirement):
+    return PermissionRequirement.compile(**requirement).is_satisfied_by(
+        GrantedPermissions(permissions))
+
+
+class PermissionsTestCase(unittest.TestCase):
+    """This class represents the permission matching test case"""
+
+    def test_exact(self):
+        self.assertTrue(holds(['get:drinks-detail'],
+                              permission='get:drinks-detail'))
+        self.assertFalse(holds(['get:drinks'], permission='get:drinks-detail'))
+        self.assertFalse(holds([], permission='get:drinks'))
+
+    def test_star_grants_everything(self):
+        self.assertTrue(holds(['*'], permission='get:drinks-detail'))
+        self.assertTrue(holds(['*'], permission='delete:drinks'))
+
+    def test_prefix_wildcard(self):
+        self.assertTrue(holds(['get:*'], permission='get:drinks-detail'))
+        self.assertTrue(holds(['get:*'], permission='get:drinks:recipe'))
+        self.assertFalse(holds(['get:*'], permission='patch:drinks'))
+        self.assertFalse(holds(['get:*'], permission='get'))
+
+    def test_segment_wildcard(self):
+        self.assertTrue(holds(['*:drinks'], permission='patch:drinks'))
+        self.assertTrue(holds(['*:drinks'], permission='delete:drinks'))
+        self.assertFalse(holds(['*:drinks'], permission='get:drinks-detail'))
+        self.assertFalse(holds(['*:drinks'], permission='patch:drinks:recipe'))
+
+    def test_resource_first_wildcard_matches_nothing(self):
+        # scopes are verb:resource, 'drinks:*' would need 'drinks:...'
+        self.assertFalse(holds(['drinks:*'], permission='get:drinks-detail'))
+
+    def test_wildcard_requirement(self):
+        self.assertTrue(holds(['patch:drinks'], permission='*:drinks'))
+        self.assertTrue(holds(['*:drinks'], permission='*:drinks'))
+        self.assertTrue(holds(['*'], permission='get:*'))
+        self.assertFalse(holds(['get:drinks-detail'], permission='*:drinks'))
+        self.assertFalse(holds(['*:drinks'], permission='get:*'))
+
+    def test_all_of(self):
+        requirement = {'all_of': ['get:drinks', 'post:drinks']}
+
+        self.assertTrue(holds(['get:drinks', 'post:drinks'], **requirement))
+        self.assertTrue(holds(['*:drinks'], **requirement))
+        self.assertFalse(holds(['get:drinks'], **requirement))
+
+    def test_any_of(self):
+        requirement = {'any_of': ['patch:drinks', 'delete:drinks']}
+
+        self.assertTrue(holds(['delete:drinks'], **requirement))
+        self.assertTrue(holds(['*:drinks'], **requirement))
+        self.assertFalse(holds(['get:drinks'], **requirement))
+
+    def test_permission_with_any_of(self):
+        requirement = {'permission': 'get:drinks-detail',
+                       'any_of': ['patch:drinks', 'post:drinks']}
+
+        self.assertTrue(holds(['get:*', 'post:drinks'], **requirement))
+        self.assertFalse(holds(['get:*'], **requirement))
+        self.assertFalse(holds(['post:drinks'], **requirement))
+
+    def test_check_permissions(self):
+        self.assertTrue(check_permissions('get:drinks-detail',
+                                          {'permissions': ['get:*']}))
+
+        with self.assertRaises(AuthError) as missing:
+            check_permissions('get:drinks-detail', {})
+        with self.assertRaises(AuthError) as denied:
+            check_permissions('get:drinks-detail',
+                              {'permissions': ['*:drinks']})
+
+        self.assertEqual(missing.exception.status_code, 400)
+        self.assertEqual(denied.exception.status_code, 403)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+'''
+TokenCache
+a bounded LRU of already verified jwt payloads
+    entries are keyed by a sha256 digest of the raw token, so the
+    bearer tokens themselves are never kept in memory, and each entry
+    expires at `expires_at`, normally the token's own `exp` claim
+    entries without an expiry are never cached
+    EXAMPLE
+        entry = cache.get(token)
+        if entry is None:
+            payload = verify_decode_jwt(token)
+            entry = (payload, GrantedPermissions(payload['permissions']))
+            cache.put(token, entry, payload.get('exp'))
+'''
+
+
+class TokenCache:
+    def __init__(self, maxsize=1024, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).hexdigest()
+
+    def get(self, token):
+        key = self.key_for(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, token, value, expires_at):
+        if not isinstance(expires_at, (int, float)) or self.maxsize <= 0:
+            return
+
+        key = self.key_for(token)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries)
+        }
@@ -3,15 +3,26 @@
 #----------------------------------------------------------------------------#
 
 import json
+import threading
+import time
+from functools import lru_cache
+from itertools import groupby
+from datetime import datetime
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, session, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import joinedload
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from name_search import NameSearch
+from page_cache import PageCache, LRUBackend, RedisBackend
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -20,6 +31,7 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
+migrate = Migrate(app, db)
 
 # TODO: connect to a local postgresql database
 
@@ -27,6 +39,30 @@ db = SQLAlchemy(app)
 # Models.
 #----------------------------------------------------------------------------#
 
+# The venues or artists of a genre are read as one range of the primary
+# key, which starts with genre_id; the second index serves the genres of
+# one venue or artist.
+venue_genres = db.Table('venue_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_venue_id_genre_id', 'venue_id', 'genre_id'),
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_artist_id_genre_id', 'artist_id', 'genre_id'),
+)
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    venues = db.relationship('Venue', secondary=venue_genres, back_populates='genres', passive_deletes=True)
+    artists = db.relationship('Artist', secondary=artist_genres, back_populates='genres', passive_deletes=True)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
 
@@ -38,8 +74,12 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name', back_populates='venues', passive_deletes=True)
+    shows = db.relationship('Show', back_populates='venue', cascade='all, delete-orphan', passive_deletes=True)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
@@ -49,32 +89,177 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name', back_populates='artists', passive_deletes=True)
+    shows = db.relationship('Show', back_populates='artist', cascade='all, delete-orphan', passive_deletes=True)
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+    # a venue's or an artist's shows are read as one range of these
+    # indexes, already ordered by start_time
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        # the /shows listing, paged by (start_time, id)
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
-
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+
+    venue = db.relationship('Venue', back_populates='shows')
+    artist = db.relationship('Artist', back_populates='shows')
+
+def past_and_upcoming_shows(shows, now=None):
+    # shows: a Show query filtered on one venue_id or artist_id. Past and
+    # upcoming shows are two ranges of its (venue_id or artist_id,
+    # start_time) index, each read by its own query already ordered by
+    # start_time.
+    now = now or datetime.now()
+    shows = shows.order_by(Show.start_time)
+    return shows.filter(Show.start_time < now).all(), shows.filter(Show.start_time >= now).all()
+
+def genres_by_name(names):
+    # the Genre rows of the given names, in the given order; the names no
+    # venue or artist had yet get a new row, added to the session so the
+    # next lookup finds it
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return []
+    genres = {genre.name: genre for genre in Genre.query.filter(Genre.name.in_(names))}
+    for name in names:
+        if name not in genres:
+            genres[name] = Genre(name=name)
+            db.session.add(genres[name])
+    return [genres[name] for name in names]
+
+def genre_names(genres):
+    return [genre.name for genre in genres]
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=64)
+def datetime_pattern(format):
+  # babel parses a pattern string on every format_datetime call, parse
+  # each one once
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+@lru_cache(maxsize=64)
+def babel_locale(locale):
+  return babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def cached_format_datetime(value, format, locale):
+  # show cards repeat the same few start times, each (value, format,
+  # locale) is parsed and formatted once
+  date = value if isinstance(value, datetime) else dateutil.parser.parse(value)
+  return datetime_pattern(format).apply(date, babel_locale(locale))
+
+def format_datetime(value, format='medium', locale=None):
+  # value: a datetime, or a string dateutil can parse
+  return cached_format_datetime(value, format, locale or babel.dates.LC_TIME)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Caches.
+#----------------------------------------------------------------------------#
+
+class VenueAreaCache:
+    # The /venues listing, one entry per (city, state) area. A venue or
+    # show write marks the areas it touches stale and only those are
+    # recomputed on the next hit. Everything is reloaded after max_age
+    # seconds, as upcoming shows become past ones with time. Entries
+    # live in this process only.
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._areas = None
+        self._stale = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def get(self, load):
+        # load(areas) returns {area: area listing} for the given
+        # (city, state) areas, or for every area when areas is None
+        with self._lock:
+            if self._areas is None or time.monotonic() - self._loaded_at >= self.max_age:
+                self.misses += 1
+                self._areas = load(None)
+                self._stale = set()
+                self._loaded_at = time.monotonic()
+            elif self._stale:
+                self.misses += 1
+                for area in self._stale:
+                    self._areas.pop(area, None)
+                self._areas.update(load(self._stale))
+                self._stale = set()
+            else:
+                self.hits += 1
+            return [self._areas[area] for area in sorted(self._areas, key=lambda area: (area[1], area[0]))]
+
+    def invalidate(self, *areas):
+        with self._lock:
+            self._stale.update(areas)
+
+    def clear(self):
+        with self._lock:
+            self._areas = None
+
+venue_areas = VenueAreaCache()
+
+def page_cache_backend():
+    url = app.config.get('PAGE_CACHE_URL')
+    if url:
+        import redis
+        return RedisBackend(redis.Redis.from_url(url))
+    return LRUBackend(max_entries=1024)
+
+# Rendered venue and artist pages and listings. Versions: 'venue:<id>'
+# and 'artist:<id>' for one venue or artist and its shows, 'venues',
+# 'artists' and 'shows' for any venue, artist or show write.
+page_cache = PageCache(page_cache_backend(), max_age=60)
+
+venue_search = NameSearch(db, Venue)
+artist_search = NameSearch(db, Artist)
+
+SEARCH_LIMIT = 50
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_BUDGET = 0.05
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
+def cached_page(page, entity_id, versions, build):
+  # a pending flash message is shown (and consumed) by the layout, such
+  # a page is built for this request only
+  if '_flashes' in session:
+    return build()
+  return page_cache.render(page, entity_id, versions, build)
+
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify({
+    "pages": page_cache.stats()
+  })
+
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -83,130 +268,125 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
+def load_venue_areas(areas=None, now=None):
+  # one aggregate query: every venue with its number of upcoming shows,
+  # ordered by area, then grouped into areas in a single pass
+  num_upcoming_shows = func.count(case([(Show.start_time >= (now or datetime.now()), Show.id)]))
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, num_upcoming_shows) \
+    .outerjoin(Show, Show.venue_id == Venue.id) \
+    .group_by(Venue.id) \
+    .order_by(Venue.state, Venue.city, Venue.id)
+  if areas is not None:
+    query = query.filter(or_(*[and_(Venue.city == city, Venue.state == state) for city, state in areas]))
+
+  data = {}
+  for (city, state), rows in groupby(query, key=lambda row: (row.city, row.state)):
+    data[(city, state)] = {
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row[4],
+      } for row in rows]
+    }
+  return data
+
 @app.route('/venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "city": "San Francisco",
-    "state": "CA",
-    "venues": [{
-      "id": 1,
-      "name": "The Musical Hop",
-      "num_upcoming_shows": 0,
-    }, {
-      "id": 3,
-      "name": "Park Square Live Music & Coffee",
-      "num_upcoming_shows": 1,
-    }]
-  }, {
-    "city": "New York",
-    "state": "NY",
-    "venues": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }]
-  return render_template('pages/venues.html', areas=data);
+  return cached_page('venues', None, ['venues', 'shows'], lambda:
+    render_template('pages/venues.html', areas=venue_areas.get(load_venue_areas)))
+
+def count_upcoming_shows(column, ids, now=None):
+  # {venue or artist id: number of upcoming shows} for the given ids,
+  # one grouped query on the (venue_id|artist_id, start_time) index
+  if not ids:
+    return {}
+  return dict(db.session.query(column, func.count(Show.id))
+    .filter(column.in_(ids), Show.start_time >= (now or datetime.now()))
+    .group_by(column))
+
+def search_results(search, column, term, limit):
+  hits, total = search.search(term, limit)
+  upcoming = count_upcoming_shows(column, [entity_id for entity_id, name in hits])
+  return {
+    "count": total,
+    "data": [{
+      "id": entity_id,
+      "name": name,
+      "num_upcoming_shows": upcoming.get(entity_id, 0),
+    } for entity_id, name in hits]
+  }
+
+def typeahead_results(search, column):
+  # top matches as JSON for a search box, served from the in-memory name
+  # index; "complete" is false when the time budget ran out first
+  limit = min(request.args.get('limit', TYPEAHEAD_LIMIT, type=int), TYPEAHEAD_LIMIT)
+  hits, complete = search.typeahead(request.args.get('search_term', ''), limit, TYPEAHEAD_BUDGET)
+  upcoming = count_upcoming_shows(column, [entity_id for entity_id, name in hits])
+  return jsonify({
+    "complete": complete,
+    "data": [{
+      "id": entity_id,
+      "name": name,
+      "num_upcoming_shows": upcoming.get(entity_id, 0),
+    } for entity_id, name in hits]
+  })
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-  response={
-    "count": 1,
-    "data": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }
+  # case-insensitive partial match on names, ranked, at most SEARCH_LIMIT hits
+  response = search_results(venue_search, Show.venue_id, request.form.get('search_term', ''), SEARCH_LIMIT)
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
+@app.route('/venues/typeahead')
+def typeahead_venues():
+  return typeahead_results(venue_search, Show.venue_id)
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "past_shows": [{
-      "artist_id": 4,
-      "artist_name": "Guns N Petals",
-      "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 2,
-    "name": "The Dueling Pianos Bar",
-    "genres": ["Classical", "R&B", "Hip-Hop"],
-    "address": "335 Delancey Street",
-    "city": "New York",
-    "state": "NY",
-    "phone": "914-003-1132",
-    "website": "https://www.theduelingpianos.com",
-    "facebook_link": "https://www.facebook.com/theduelingpianos",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1497032205916-ac775f0649ae?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=750&q=80",
-    "past_shows": [],
-    "upcoming_shows": [],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 0,
+  # shows the venue page with the given venue_id, with the names of the
+  # artists playing there
+  return cached_page('show_venue', venue_id, ['venue:%d' % venue_id, 'artists'], lambda:
+    render_venue(venue_id))
+
+def render_venue(venue_id):
+  venue = Venue.query.options(joinedload(Venue.genres)).filter_by(id=venue_id).one_or_none()
+  if venue is None:
+    abort(404)
+
+  # one statement for the past shows and one for the upcoming ones: each
+  # show's artist is joined in, with only the columns the show cards use
+  past_shows, upcoming_shows = past_and_upcoming_shows(Show.query
+    .options(joinedload(Show.artist, innerjoin=True).load_only(Artist.name, Artist.image_link))
+    .filter(Show.venue_id == venue_id))
+
+  def format_show(show):
+    return {
+      "artist_id": show.artist_id,
+      "artist_name": show.artist.name,
+      "artist_image_link": show.artist.image_link,
+      "start_time": show.start_time
+    }
+
+  data={
+    "id": venue.id,
+    "name": venue.name,
+    "genres": genre_names(venue.genres),
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": [format_show(show) for show in past_shows],
+    "upcoming_shows": [format_show(show) for show in upcoming_shows],
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
   }
-  data3={
-    "id": 3,
-    "name": "Park Square Live Music & Coffee",
-    "genres": ["Rock n Roll", "Jazz", "Classical", "Folk"],
-    "address": "34 Whiskey Moore Ave",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "415-000-1234",
-    "website": "https://www.parksquarelivemusicandcoffee.com",
-    "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-    "past_shows": [{
-      "artist_id": 5,
-      "artist_name": "Matt Quevedo",
-      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 1,
-  }
-  data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
@@ -217,189 +397,189 @@ def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
+def venue_from_form(venue, form):
+  venue.name = form['name']
+  venue.city = form['city']
+  venue.state = form['state']
+  venue.address = form['address']
+  venue.phone = form.get('phone')
+  venue.image_link = form.get('image_link')
+  venue.genres = genres_by_name(form.getlist('genres'))
+  venue.facebook_link = form.get('facebook_link')
+  return venue
+
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  try:
+    venue = venue_from_form(Venue(), request.form)
+    db.session.add(venue)
+    db.session.commit()
+    venue_areas.invalidate((venue.city, venue.state))
+    venue_search.invalidate()
+    page_cache.bump('venues')
+    # on successful db insert, flash success
+    flash('Venue ' + request.form['name'] + ' was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    flash('An error occurred. Venue ' + request.form.get('name', '') + ' could not be listed.')
+  finally:
+    db.session.close()
   return render_template('pages/home.html')
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  try:
+    venue = Venue.query.get(venue_id)
+    if venue is None:
+      abort(404)
+    area = (venue.city, venue.state)
+    version = 'venue:%d' % venue.id
+    db.session.delete(venue)
+    db.session.commit()
+    venue_areas.invalidate(area)
+    venue_search.invalidate()
+    page_cache.bump(version, 'venues')
+  except Exception:
+    db.session.rollback()
+    raise
+  finally:
+    db.session.close()
+  return Response(status=204)
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[{
-    "id": 4,
-    "name": "Guns N Petals",
-  }, {
-    "id": 5,
-    "name": "Matt Quevedo",
-  }, {
-    "id": 6,
-    "name": "The Wild Sax Band",
-  }]
+  return cached_page('artists', None, ['artists'], render_artists)
+
+def render_artists():
+  data = [{
+    "id": row.id,
+    "name": row.name,
+  } for row in db.session.query(Artist.id, Artist.name).order_by(Artist.name, Artist.id)]
   return render_template('pages/artists.html', artists=data)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-  response={
-    "count": 1,
-    "data": [{
-      "id": 4,
-      "name": "Guns N Petals",
-      "num_upcoming_shows": 0,
-    }]
-  }
+  # case-insensitive partial match on names, ranked, at most SEARCH_LIMIT hits
+  response = search_results(artist_search, Show.artist_id, request.form.get('search_term', ''), SEARCH_LIMIT)
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
+@app.route('/artists/typeahead')
+def typeahead_artists():
+  return typeahead_results(artist_search, Show.artist_id)
+
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "past_shows": [{
-      "venue_id": 1,
-      "venue_name": "The Musical Hop",
-      "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
+  # shows the artist page with the given artist_id, with the names of
+  # the venues the artist plays at
+  return cached_page('show_artist', artist_id, ['artist:%d' % artist_id, 'venues'], lambda:
+    render_artist(artist_id))
+
+def render_artist(artist_id):
+  artist = Artist.query.options(joinedload(Artist.genres)).filter_by(id=artist_id).one_or_none()
+  if artist is None:
+    abort(404)
+
+  # one statement for the past shows and one for the upcoming ones: each
+  # show's venue is joined in, with only the columns the show cards use
+  past_shows, upcoming_shows = past_and_upcoming_shows(Show.query
+    .options(joinedload(Show.venue, innerjoin=True).load_only(Venue.name, Venue.image_link))
+    .filter(Show.artist_id == artist_id))
+
+  def format_show(show):
+    return {
+      "venue_id": show.venue_id,
+      "venue_name": show.venue.name,
+      "venue_image_link": show.venue.image_link,
+      "start_time": show.start_time
+    }
+
+  data={
+    "id": artist.id,
+    "name": artist.name,
+    "genres": genre_names(artist.genres),
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": [format_show(show) for show in past_shows],
+    "upcoming_shows": [format_show(show) for show in upcoming_shows],
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
   }
-  data2={
-    "id": 5,
-    "name": "Matt Quevedo",
-    "genres": ["Jazz"],
-    "city": "New York",
-    "state": "NY",
-    "phone": "300-400-5000",
-    "facebook_link": "https://www.facebook.com/mattquevedo923251523",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "past_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 6,
-    "name": "The Wild Sax Band",
-    "genres": ["Jazz", "Classical"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "432-325-5432",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "past_shows": [],
-    "upcoming_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 3,
-  }
-  data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
 #  ----------------------------------------------------------------
+def artist_from_form(artist, form):
+  artist.name = form['name']
+  artist.city = form['city']
+  artist.state = form['state']
+  artist.phone = form.get('phone')
+  artist.image_link = form.get('image_link')
+  artist.genres = genres_by_name(form.getlist('genres'))
+  artist.facebook_link = form.get('facebook_link')
+  return artist
+
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
-  artist={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80"
-  }
-  # TODO: populate form with fields from artist with ID <artist_id>
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    abort(404)
+  form = ArtistForm(obj=artist)
+  form.genres.data = genre_names(artist.genres)
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    abort(404)
+  try:
+    artist_from_form(artist, request.form)
+    db.session.commit()
+    artist_search.invalidate()
+    page_cache.bump('artist:%d' % artist_id, 'artists')
+  except Exception:
+    db.session.rollback()
+    flash('An error occurred. Artist ' + request.form.get('name', '') + ' could not be updated.')
+  finally:
+    db.session.close()
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  form = VenueForm()
-  venue={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60"
-  }
-  # TODO: populate form with values from venue with ID <venue_id>
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    abort(404)
+  form = VenueForm(obj=venue)
+  form.genres.data = genre_names(venue.genres)
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    abort(404)
+  try:
+    # the venue may move to another area, both are stale
+    old_area = (venue.city, venue.state)
+    venue_from_form(venue, request.form)
+    new_area = (venue.city, venue.state)
+    db.session.commit()
+    venue_areas.invalidate(old_area, new_area)
+    venue_search.invalidate()
+    page_cache.bump('venue:%d' % venue_id, 'venues')
+  except Exception:
+    db.session.rollback()
+    flash('An error occurred. Venue ' + request.form.get('name', '') + ' could not be updated.')
+  finally:
+    db.session.close()
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -413,61 +593,136 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
+  try:
+    artist = artist_from_form(Artist(), request.form)
+    db.session.add(artist)
+    db.session.commit()
+    artist_search.invalidate()
+    page_cache.bump('artists')
+    # on successful db insert, flash success
+    flash('Artist ' + request.form['name'] + ' was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    flash('An error occurred. Artist ' + request.form.get('name', '') + ' could not be listed.')
+  finally:
+    db.session.close()
   return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+@app.route('/genres')
+def genres():
+  # every genre with its number of venues and artists, counted on the
+  # association tables' primary keys
+  venue_counts = dict(db.session.query(venue_genres.c.genre_id, func.count())
+    .group_by(venue_genres.c.genre_id))
+  artist_counts = dict(db.session.query(artist_genres.c.genre_id, func.count())
+    .group_by(artist_genres.c.genre_id))
+  data = [{
+    "name": genre.name,
+    "num_venues": venue_counts.get(genre.id, 0),
+    "num_artists": artist_counts.get(genre.id, 0),
+  } for genre in Genre.query.order_by(Genre.name)]
+  return render_template('pages/genres.html', genres=data)
+
+@app.route('/genres/<genre_name>')
+def show_genre(genre_name):
+  # the venues and artists of one genre: the genre is found on the unique
+  # name index, its venues and artists on the (genre_id, ...) primary key
+  # ranges of the association tables
+  genre = Genre.query.filter_by(name=genre_name).first()
+  if genre is None:
+    abort(404)
+
+  venues = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state) \
+    .join(venue_genres, venue_genres.c.venue_id == Venue.id) \
+    .filter(venue_genres.c.genre_id == genre.id) \
+    .order_by(Venue.name)
+  artists = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state) \
+    .join(artist_genres, artist_genres.c.artist_id == Artist.id) \
+    .filter(artist_genres.c.genre_id == genre.id) \
+    .order_by(Artist.name)
+
+  data={
+    "name": genre.name,
+    "venues": [row._asdict() for row in venues],
+    "artists": [row._asdict() for row in artists],
+  }
+  return render_template('pages/show_genre.html', genre=data)
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
+SHOWS_PER_PAGE = 30
+
+def encode_show_cursor(start_time, show_id):
+  return '{}_{}'.format(start_time.isoformat(), show_id)
+
+def decode_show_cursor(cursor):
+  start_time, show_id = cursor.rsplit('_', 1)
+  return dateutil.parser.parse(start_time), int(show_id)
+
+def stream_template(template_name, **context):
+  # like render_template, but yields the page as it is rendered
+  app.update_template_context(context)
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(5)
+  return stream
+
 @app.route('/shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "venue_id": 1,
-    "venue_name": "The Musical Hop",
-    "artist_id": 4,
-    "artist_name": "Guns N Petals",
-    "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "start_time": "2019-05-21T21:30:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 5,
-    "artist_name": "Matt Quevedo",
-    "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "start_time": "2019-06-15T23:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-01T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-08T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-15T20:00:00.000Z"
-  }]
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, ordered by start time
+  #   ?after=<cursor>  the page after the one whose next link held cursor
+  #   ?upcoming=true   only shows that have not started yet
+  #   ?stream=true     every show from the cursor on, streamed while rendered
+  upcoming_only = request.args.get('upcoming', 'false').lower() in ('1', 'true')
+  streamed = request.args.get('stream', 'false').lower() in ('1', 'true')
+  cursor = request.args.get('after')
+
+  query = db.session.query(
+      Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+      Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link')) \
+    .join(Venue, Show.venue_id == Venue.id) \
+    .join(Artist, Show.artist_id == Artist.id) \
+    .order_by(Show.start_time, Show.id)
+  if upcoming_only:
+    query = query.filter(Show.start_time >= datetime.now())
+  if cursor:
+    try:
+      start_time, show_id = decode_show_cursor(cursor)
+    except ValueError:
+      abort(400)
+    query = query.filter(or_(Show.start_time > start_time,
+                             and_(Show.start_time == start_time, Show.id > show_id)))
+
+  def format_show(row):
+    return {
+      "venue_id": row.venue_id,
+      "venue_name": row.venue_name,
+      "artist_id": row.artist_id,
+      "artist_name": row.artist_name,
+      "artist_image_link": row.artist_image_link,
+      "start_time": row.start_time
+    }
+
+  if streamed:
+    # rows are fetched in batches and rendered as they come, so neither
+    # the rows nor the page are ever held whole
+    data = (format_show(row) for row in query.yield_per(500))
+    return Response(stream_with_context(stream_template('pages/shows.html', shows=data, next_url=None)))
+
+  # one row more than the page tells whether there is a next page
+  rows = query.limit(SHOWS_PER_PAGE + 1).all()
+  next_url = None
+  if len(rows) > SHOWS_PER_PAGE:
+    rows = rows[:SHOWS_PER_PAGE]
+    last = rows[-1]
+    next_url = url_for('shows', after=encode_show_cursor(last.start_time, last.id),
+                       upcoming='true' if upcoming_only else None)
+  return render_template('pages/shows.html', shows=[format_show(row) for row in rows], next_url=next_url)
 
 @app.route('/shows/create')
 def create_shows():
@@ -478,13 +733,24 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
-
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  try:
+    show = Show(
+      artist_id=int(request.form['artist_id']),
+      venue_id=int(request.form['venue_id']),
+      start_time=dateutil.parser.parse(request.form['start_time'])
+    )
+    db.session.add(show)
+    db.session.commit()
+    venue = show.venue
+    venue_areas.invalidate((venue.city, venue.state))
+    page_cache.bump('venue:%d' % show.venue_id, 'artist:%d' % show.artist_id, 'shows')
+    # on successful db insert, flash success
+    flash('Show was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    flash('An error occurred. Show could not be listed.')
+  finally:
+    db.session.close()
   return render_template('pages/home.html')
 
 @app.errorhandler(404)
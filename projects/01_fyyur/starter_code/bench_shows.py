@@ -0,0 +1,83 @@
+#----------------------------------------------------------------------------#
+# bench_shows.py
+#
+# Renders pages/shows.html with 10,000 shows through the former datetime
+# filter (parse the ISO string with dateutil, format with babel on every
+# call) and through format_datetime (datetimes, compiled patterns,
+# memoized results). Shows start on a limited set of slots, like a real
+# calendar: --slots distinct start times shared by all the shows.
+#
+# No database is needed, the shows are generated in memory.
+#
+# USAGE (from the starter_code directory)
+#     python bench_shows.py
+#     python bench_shows.py --shows 10000 --slots 200 --renders 5
+#----------------------------------------------------------------------------#
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+from app import app, format_datetime, cached_format_datetime
+
+
+def former_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+def make_shows(count, slots):
+  start = datetime(2021, 1, 1, 20, 0)
+  times = [start + timedelta(days=day // 2, hours=3 * (day % 2)) for day in range(slots)]
+  return [{
+    "venue_id": i % 50 + 1,
+    "venue_name": "Venue {}".format(i % 50 + 1),
+    "artist_id": i % 500 + 1,
+    "artist_name": "Artist {}".format(i % 500 + 1),
+    "artist_image_link": "https://example.com/artist/{}.jpg".format(i % 500 + 1),
+    "start_time": random.choice(times)
+  } for i in range(count)]
+
+def time_renders(shows, renders):
+  started = time.perf_counter()
+  for _ in range(renders):
+    page = render_template('pages/shows.html', shows=shows, next_url=None)
+  return (time.perf_counter() - started) / renders * 1000, page
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--shows', type=int, default=10000)
+  parser.add_argument('--slots', type=int, default=200)
+  parser.add_argument('--renders', type=int, default=5)
+  args = parser.parse_args()
+
+  shows = make_shows(args.shows, args.slots)
+  string_shows = [dict(show, start_time=show['start_time'].isoformat()) for show in shows]
+
+  with app.test_request_context('/shows'):
+    app.jinja_env.filters['datetime'] = former_format_datetime
+    old, old_page = time_renders(string_shows, args.renders)
+
+    app.jinja_env.filters['datetime'] = format_datetime
+    cached_format_datetime.cache_clear()
+    first, page = time_renders(shows, 1)
+    warm, page = time_renders(shows, args.renders)
+
+  assert page == old_page, 'format_datetime renders differently from the former filter'
+  print('{:>8} {:>6} {:>12} {:>12} {:>12} {:>10}'.format(
+    'shows', 'slots', 'former ms', 'first ms', 'cached ms', 'speedup'))
+  print('{:>8,} {:>6} {:>12.1f} {:>12.1f} {:>12.1f} {:>9.0f}x'.format(
+    args.shows, args.slots, old, first, warm, old / warm))
+  print(cached_format_datetime.cache_info())
+
+
+if __name__ == '__main__':
+  main()
@@ -11,3 +11,7 @@ DEBUG = True
 
 # TODO IMPLEMENT DATABASE URL
 SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+
+# Rendered pages are cached in each process, or in the redis server at
+# this URL (needs the redis package) to share them between processes
+PAGE_CACHE_URL = os.environ.get('PAGE_CACHE_URL')
@@ -0,0 +1,38 @@
+"""name trigram indexes
+
+pg_trgm GIN indexes on the venue and artist names, used by the name
+search (name_search.py) for ILIKE '%term%'. PostgreSQL only, other
+databases search the names in memory.
+
+Revision ID: 42fe40a9de04
+Revises: 00f26b9fb2c1
+Create Date: 2026-10-17 06:32:04.903342
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '42fe40a9de04'
+down_revision = '00f26b9fb2c1'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['Venue', 'Artist']
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        op.execute('CREATE INDEX IF NOT EXISTS ix_{0}_name_trgm '
+                   'ON "{1}" USING gin (name gin_trgm_ops)'.format(table.lower(), table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in TABLES:
+        op.execute('DROP INDEX IF EXISTS ix_{0}_name_trgm'.format(table.lower()))
@@ -0,0 +1,187 @@
+#----------------------------------------------------------------------------#
+# Name search for venues and artists.
+#
+# Matching is case-insensitive and partial: "hop" finds "The Musical Hop".
+# Hits are ranked: names starting with the term first, then names with a
+# word (after a space) starting with it, then any other match; ties go
+# to the earlier match position, the shorter name, then alphabetical
+# order.
+#
+# On PostgreSQL the search runs in SQL on a pg_trgm GIN index, which
+# serves ILIKE '%term%' for terms of 3 characters and more. The indexes
+# are created by a migration (flask db upgrade), never by a request.
+# Elsewhere, or before that migration ran, it runs on an in-memory
+# trigram index of the names. Typeahead always uses the in-memory index,
+# under a time budget.
+#----------------------------------------------------------------------------#
+
+import heapq
+import logging
+import threading
+import time
+
+from sqlalchemy import case, func, text
+
+logger = logging.getLogger(__name__)
+
+
+def rank(name, term):
+    # sort key of a matching lowercased name, lower is better
+    if name.startswith(term):
+        kind = 0
+    elif ' ' + term in name:
+        kind = 1
+    else:
+        kind = 2
+    return (kind, name.find(term), len(name), name)
+
+
+EMPTY_SNAPSHOT = ({}, {}, {})
+
+
+class NgramIndex:
+    # the lowercased names of one model and, for each trigram, the ids of
+    # the names containing it; a term of n characters or more is looked up
+    # through the postings of its trigrams, a shorter one scans the names.
+    # Reloaded after invalidate() and at least every max_age seconds.
+    #
+    # The index is one (names, display_names, postings) snapshot, built
+    # aside and swapped in whole, never changed afterwards. A search reads
+    # it once, so a reload running meanwhile cannot mix two versions.
+
+    def __init__(self, n=3, max_age=60):
+        self.n = n
+        self.max_age = max_age
+        self._snapshot = EMPTY_SNAPSHOT
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def grams(self, name):
+        return set(name[i:i + self.n] for i in range(len(name) - self.n + 1))
+
+    def is_fresh(self):
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at < self.max_age
+
+    def ensure_loaded(self, load, wait=True):
+        # wait=False keeps serving the current snapshot while another
+        # thread reloads it, as long as there is one
+        if self.is_fresh():
+            return
+        if not self._lock.acquire(blocking=wait or self._snapshot is EMPTY_SNAPSHOT):
+            return
+        try:
+            if self.is_fresh():
+                return
+            names = {}
+            display_names = {}
+            postings = {}
+            for entity_id, name in load():
+                display_names[entity_id] = name
+                name = (name or '').lower()
+                names[entity_id] = name
+                for gram in self.grams(name):
+                    postings.setdefault(gram, set()).add(entity_id)
+            self._snapshot = (names, display_names, postings)
+            self._loaded_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def matches(self, term, deadline=None, snapshot=None):
+        # (ids of the names containing term, whether every name was checked
+        # before the deadline)
+        names, _, postings = snapshot or self._snapshot
+        if len(term) >= self.n:
+            grams = sorted((postings.get(gram, ()) for gram in self.grams(term)), key=len)
+            candidates = set(grams[0]).intersection(*grams[1:]) if grams else set()
+        else:
+            candidates = names
+
+        found = []
+        for checked, entity_id in enumerate(candidates):
+            if deadline is not None and checked % 512 == 0 and time.monotonic() > deadline:
+                return found, False
+            if term in names[entity_id]:
+                found.append(entity_id)
+        return found, True
+
+    def search(self, term, limit, deadline=None):
+        # ([(id, name)] of the top `limit` hits, total, complete)
+        snapshot = self._snapshot
+        names, display_names, _ = snapshot
+        found, complete = self.matches(term, deadline, snapshot)
+        top = heapq.nsmallest(limit, found, key=lambda entity_id: rank(names[entity_id], term))
+        return [(entity_id, display_names[entity_id]) for entity_id in top], len(found), complete
+
+
+class NameSearch:
+    # search(term, limit) -> ([(id, name)], total)
+    # typeahead(term, limit, budget) -> ([(id, name)], complete)
+
+    def __init__(self, db, model, max_age=60):
+        self.db = db
+        self.model = model
+        self.index = NgramIndex(max_age=max_age)
+        self._trigram_ready = None
+
+    def invalidate(self):
+        self.index.invalidate()
+
+    def search(self, term, limit):
+        term = (term or '').strip().lower()
+        if not term:
+            return [], 0
+        if self.trigram_ready():
+            return self._search_sql(term, limit)
+        hits, total, complete = self._search_memory(term, limit)
+        return hits, total
+
+    def typeahead(self, term, limit, budget):
+        # the budget covers loading the index too: a reload that outlasts
+        # it leaves no time for the search, which returns incomplete
+        deadline = time.monotonic() + budget
+        term = (term or '').strip().lower()
+        if not term:
+            return [], True
+        hits, total, complete = self._search_memory(term, limit, deadline)
+        return hits, complete
+
+    def trigram_index(self):
+        return 'ix_{}_name_trgm'.format(self.model.__table__.name.lower())
+
+    def trigram_ready(self):
+        # whether the migration created the pg_trgm index, checked once
+        if self._trigram_ready is None:
+            self._trigram_ready = False
+            if self.db.engine.dialect.name == 'postgresql':
+                self._trigram_ready = self.db.session.execute(
+                    text('SELECT 1 FROM pg_indexes WHERE indexname = :name'),
+                    {'name': self.trigram_index()}).first() is not None
+                if not self._trigram_ready:
+                    logger.warning('%s is missing (flask db upgrade), %s names are searched in memory',
+                                   self.trigram_index(), self.model.__table__.name)
+        return self._trigram_ready
+
+    def _search_sql(self, term, limit):
+        model = self.model
+        pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        name = func.lower(model.name)
+        kind = case([(name.like(pattern + '%', escape='\\'), 0),
+                     (name.like('% ' + pattern + '%', escape='\\'), 1)], else_=2)
+        rows = self.db.session.query(model.id, model.name, func.count().over()) \
+            .filter(model.name.ilike('%' + pattern + '%', escape='\\')) \
+            .order_by(kind, func.strpos(name, term), func.length(model.name), name) \
+            .limit(limit).all()
+        total = rows[0][2] if rows else 0
+        return [(row[0], row[1]) for row in rows], total
+
+    def _search_memory(self, term, limit, deadline=None):
+        # a typeahead (with a deadline) does not wait for a reload another
+        # request is running, it searches the current snapshot
+        model = self.model
+        self.index.ensure_loaded(lambda: self.db.session.query(model.id, model.name), wait=deadline is None)
+        return self.index.search(term, limit, deadline)
@@ -0,0 +1,172 @@
+#----------------------------------------------------------------------------#
+# Page cache for rendered pages.
+#
+# A page is stored under its name, its entity id (None for listings) and
+# the current version of each piece of data it shows. A write bumps the
+# versions it touches, e.g. 'venue:3' and 'venues' for an edit of venue
+# 3, so the pages built on the old versions are never read again and age
+# out of the backend. Pages also expire after max_age seconds, as
+# upcoming shows become past ones with time.
+#
+# Versions are random tokens kept in the backend, next to the pages: a
+# shared backend invalidates the pages of every process, and a version
+# lost to eviction is replaced by a new token instead of starting over
+# at an old one.
+#
+# Backends: LRUBackend keeps pages in this process; RedisBackend adapts a
+# client with redis-py's get/set/delete (or anything with that interface)
+# so several processes share one cache.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class CacheBackend(ABC):
+    # get(key) -> str or None, set(key, value, ttl) with ttl in seconds
+    # (None: no expiry), delete(key), clear()
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class LRUBackend(CacheBackend):
+    # at most max_entries values, the least recently used one is evicted
+    # first
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend(CacheBackend):
+    # keys are prefixed so the cache can share a database; clear() only
+    # drops the keys under the prefix
+
+    def __init__(self, client, prefix='fyyur:page:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) if ttl is not None else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class PageCache:
+    # render(page, entity_id, versions, build) -> the page, from the cache
+    # or from build() (then stored); versions names the data the page
+    # shows. bump(*versions) after a write to any of that data.
+
+    def __init__(self, backend=None, max_age=60):
+        self.backend = backend or LRUBackend()
+        self.max_age = max_age
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+
+    def version(self, name):
+        token = self.backend.get('version:' + name)
+        if token is None:
+            token = uuid.uuid4().hex
+            self.backend.set('version:' + name, token)
+        return token
+
+    def bump(self, *names):
+        for name in names:
+            self.backend.set('version:' + name, uuid.uuid4().hex)
+
+    def key(self, page, entity_id, versions):
+        return 'page:{}:{}:{}'.format(page, entity_id, ':'.join(self.version(name) for name in versions))
+
+    def render(self, page, entity_id, versions, build):
+        key = self.key(page, entity_id, versions)
+        body = self.backend.get(key)
+        if body is not None:
+            self._count(self.hits, page)
+            return body
+        self._count(self.misses, page)
+        body = build()
+        self.backend.set(key, body, self.max_age)
+        return body
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = {}
+            self.misses = {}
+
+    def stats(self):
+        # {page: {"hits", "misses", "hit_ratio"}} for every page requested
+        # since the last clear()
+        pages = {}
+        for page in sorted(set(self.hits) | set(self.misses)):
+            hits = self.hits.get(page, 0)
+            misses = self.misses.get(page, 0)
+            pages[page] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses),
+            }
+        return pages
+
+    def _count(self, counts, page):
+        with self._lock:
+            counts[page] = counts.get(page, 0) + 1
@@ -0,0 +1,418 @@
+import os
+import re
+import time
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import template_rendered
+from sqlalchemy import event
+
+from app import app, db, format_datetime, genres_by_name, load_venue_areas, page_cache, past_and_upcoming_shows, \
+    venue_areas, venue_search, artist_search, Venue, Artist, Show, SEARCH_LIMIT
+from name_search import NameSearch
+from page_cache import CacheBackend
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.database_name = "fyyur_test"
+        self.database_path = os.environ.get(
+            'FYYUR_TEST_DATABASE_URL',
+            "postgres://postgres:postgres@{}/{}".format('localhost:5432', self.database_name))
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_path
+        app.config['TESTING'] = True
+        self.client = app.test_client
+
+        self.context = app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+        # ids start over with the tables, pages cached by an earlier test
+        # would be served for new rows
+        page_cache.clear()
+        venue_areas.clear()
+        venue_search.invalidate()
+        artist_search.invalidate()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    @contextmanager
+    def assertNumQueries(self, expected):
+        """Fails unless the block runs exactly `expected` SQL statements."""
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(len(statements), expected, '\n\n'.join(statements))
+
+    @contextmanager
+    def rendered(self):
+        """Collects the context of every template rendered in the block."""
+        contexts = []
+
+        def record(sender, template, context, **extra):
+            contexts.append(context)
+
+        template_rendered.connect(record, app)
+        try:
+            yield contexts
+        finally:
+            template_rendered.disconnect(record, app)
+
+    def add_shows(self, venue, artists, count):
+        now = datetime.now()
+        for i in range(count):
+            db.session.add(Show(venue=venue, artist=artists[i % len(artists)],
+                                start_time=now + timedelta(days=i - count // 2, hours=12)))
+        db.session.commit()
+
+    def add_venue(self, name, genres=('Jazz',), city='San Francisco', state='CA'):
+        venue = Venue(name=name, city=city, state=state, address='1015 Folsom Street',
+                      genres=genres_by_name(genres))
+        db.session.add(venue)
+        return venue
+
+    def add_artists(self, count, genres=('Jazz',)):
+        artists = [Artist(name='Artist {}'.format(i), city='San Francisco', state='CA',
+                          genres=genres_by_name(genres))
+                   for i in range(count)]
+        db.session.add_all(artists)
+        return artists
+
+    """
+    2 Tests Cases for the show_venue
+    The first test for the expected behavior (past and upcoming shows of the venue)
+    The second test checks that the page costs the same number of statements with 1 show or with 40 shows by 40 artists
+    """
+    def test_show_venue(self):
+        venue = self.add_venue('The Musical Hop')
+        self.add_shows(venue, self.add_artists(3), 6)
+
+        res = self.client().get('/venues/{}'.format(venue.id))
+        page = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('The Musical Hop', page)
+        self.assertIn('3 Upcoming Shows', page)
+        self.assertIn('3 Past Shows', page)
+        self.assertIn('Artist 2', page)
+
+    def test_show_venue_queries(self):
+        small = self.add_venue('Small Venue')
+        large = self.add_venue('Large Venue')
+        self.add_shows(small, self.add_artists(1), 1)
+        self.add_shows(large, self.add_artists(40), 40)
+        urls = ['/venues/{}'.format(venue.id) for venue in (small, large)]
+        db.session.expire_all()
+
+        for url in urls:
+            with self.assertNumQueries(3):
+                self.client().get(url)
+
+    """
+    2 Tests Cases for the show_artist
+    The first test checks that the page costs the same number of statements with 1 show or with 40 shows at 40 venues
+    The second test for handling one kind of error (404: Not Found - when the artist does not exist)
+    """
+    def test_show_artist_queries(self):
+        artists = self.add_artists(2)
+        venues = [self.add_venue('Venue {}'.format(i)) for i in range(40)]
+        self.add_shows(venues[0], artists[:1], 1)
+        for venue in venues:
+            self.add_shows(venue, artists[1:], 1)
+        urls = ['/artists/{}'.format(artist.id) for artist in artists]
+        db.session.expire_all()
+
+        for url in urls:
+            with self.assertNumQueries(3):
+                res = self.client().get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Venue 39', res.data.decode())
+
+    def test_show_artist_not_found(self):
+        res = self.client().get('/artists/1000')
+
+        self.assertEqual(res.status_code, 404)
+
+    """
+    2 Tests Cases for the venues listing
+    The first test groups the venues by area and counts their upcoming shows, like the venue page does, in 1 statement
+    The second test checks that a show or venue write reloads only the areas it touches
+    """
+    def test_venue_areas(self):
+        now = datetime.now().replace(microsecond=0)
+        hop = self.add_venue('The Musical Hop')
+        self.add_venue('Park Square Live Music')
+        self.add_venue('The Dueling Pianos Bar', city='New York', state='NY')
+        artist = self.add_artists(1)[0]
+        for days in (-2, -1, 0, 1, 2):
+            db.session.add(Show(venue=hop, artist=artist, start_time=now + timedelta(days=days)))
+        db.session.commit()
+        past, upcoming = past_and_upcoming_shows(Show.query.filter_by(venue_id=hop.id), now)
+
+        with self.assertNumQueries(1):
+            areas = load_venue_areas(now=now)
+
+        self.assertEqual(list(areas), [('San Francisco', 'CA'), ('New York', 'NY')])
+        self.assertEqual(areas[('San Francisco', 'CA')]['venues'], [
+            {'id': 1, 'name': 'The Musical Hop', 'num_upcoming_shows': 3},
+            {'id': 2, 'name': 'Park Square Live Music', 'num_upcoming_shows': 0}])
+        self.assertEqual(areas[('New York', 'NY')]['venues'][0]['num_upcoming_shows'], 0)
+        self.assertEqual(len(upcoming), 3)
+
+    def test_venue_areas_reload_written_areas(self):
+        hop = self.add_venue('The Musical Hop')
+        self.add_venue('The Dueling Pianos Bar', city='New York', state='NY')
+        artist = self.add_artists(1)[0]
+        db.session.commit()
+        hop_id, artist_id = hop.id, artist.id
+        loads = []
+
+        def load(areas):
+            loads.append(areas)
+            return load_venue_areas(areas)
+
+        venue_areas.get(load)
+        self.client().post('/shows/create', data={
+            'artist_id': artist_id, 'venue_id': hop_id,
+            'start_time': (datetime.now() + timedelta(days=1)).isoformat()})
+        with self.assertNumQueries(1):
+            after_show = venue_areas.get(load)
+        self.client().post('/venues/2/edit', data={
+            'name': 'The Dueling Pianos Bar', 'city': 'Boston', 'state': 'MA',
+            'address': '335 Delancey Street', 'genres': ['Jazz']})
+        after_edit = venue_areas.get(load)
+        with self.assertNumQueries(0):
+            venue_areas.get(load)
+
+        self.assertEqual(loads, [None, {('San Francisco', 'CA')}, {('New York', 'NY'), ('Boston', 'MA')}])
+        self.assertEqual(after_show[0]['venues'][0]['num_upcoming_shows'], 1)
+        self.assertEqual([(area['city'], area['state']) for area in after_edit],
+                         [('San Francisco', 'CA'), ('Boston', 'MA')])
+
+    """
+    2 Tests Cases for the shows
+    The first test follows the next link from the first page, the second page holds the remaining shows
+    The second test streams every upcoming show in one response
+    """
+    def test_shows_pagination(self):
+        self.add_shows(self.add_venue('The Musical Hop'), self.add_artists(3), 35)
+
+        res = self.client().get('/shows')
+        page = res.data.decode()
+        next_url = re.search(r'href="(/shows\?after=[^"]+)"', page).group(1)
+        res = self.client().get(next_url)
+
+        self.assertEqual(page.count('tile-show'), 30)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data.decode().count('tile-show'), 5)
+        self.assertNotIn('More shows', res.data.decode())
+
+    def test_shows_streamed(self):
+        self.add_shows(self.add_venue('The Musical Hop'), self.add_artists(3), 40)
+
+        res = self.client().get('/shows?upcoming=true&stream=true')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.data.decode().count('tile-show'), 20)
+    """
+    Test Case for the datetime filter
+    A datetime and its ISO string render the same, in the named formats and in a babel pattern
+    """
+    def test_format_datetime(self):
+        start_time = datetime(2035, 4, 1, 20, 0)
+
+        self.assertEqual(format_datetime(start_time, 'full'), "Sunday April, 1, 2035 at 8:00PM")
+        self.assertEqual(format_datetime(start_time.isoformat(), 'full'), format_datetime(start_time, 'full'))
+        self.assertEqual(format_datetime(start_time, 'medium'), format_datetime('2035-04-01T20:00:00', 'medium'))
+        self.assertEqual(format_datetime(start_time, 'yyyy-MM-dd'), '2035-04-01')
+
+    """
+    3 Tests Cases for the genres
+    The first test lists only the venues and artists of the genre, the second updates the genres of a venue
+    The third test for handling one kind of error (404: Not Found - when the genre does not exist)
+    """
+    def test_show_genre(self):
+        self.add_venue('The Musical Hop', genres=['Jazz', 'Swing'])
+        self.add_venue('Park Square Live Music', genres=['Rock n Roll'])
+        self.add_artists(2, genres=['Swing'])
+        db.session.commit()
+
+        res = self.client().get('/genres/Swing')
+        page = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('The Musical Hop', page)
+        self.assertNotIn('Park Square Live Music', page)
+        self.assertIn('2 Artists', page)
+
+    def test_edit_venue_genres(self):
+        venue = self.add_venue('The Musical Hop', genres=['Jazz', 'Swing'])
+        db.session.commit()
+        venue_id = venue.id
+
+        res = self.client().post('/venues/{}/edit'.format(venue_id), data={
+            'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1015 Folsom Street', 'genres': ['Swing', 'Folk']})
+        page = self.client().get('/genres').data.decode()
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual([genre.name for genre in Venue.query.get(venue_id).genres], ['Folk', 'Swing'])
+        self.assertIn('Jazz', page)
+        self.assertIn('0 Venues', page)
+
+    def test_show_genre_not_found(self):
+        res = self.client().get('/genres/Polka')
+
+        self.assertEqual(res.status_code, 404)
+
+    """
+    4 Tests Cases for the page cache
+    The first test serves a venue page again without any statement, until the venue is edited
+    The second test serves the artists listing from the cache until an artist is created
+    The third test reports the hits and misses of each page
+    The fourth test checks that a cache backend missing a method cannot be created
+    """
+    def test_show_venue_cached(self):
+        venue = self.add_venue('The Musical Hop')
+        self.add_shows(venue, self.add_artists(2), 4)
+        venue_id = venue.id
+        url = '/venues/{}'.format(venue_id)
+        first = self.client().get(url).data
+
+        with self.assertNumQueries(0):
+            second = self.client().get(url).data
+        self.client().post('/venues/{}/edit'.format(venue_id), data={
+            'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY',
+            'address': '335 Delancey Street', 'genres': ['Jazz']})
+        res = self.client().get(url)
+
+        self.assertEqual(first, second)
+        self.assertIn('The Dueling Pianos Bar', res.data.decode())
+
+    def test_artists_cached(self):
+        self.add_artists(2)
+        db.session.commit()
+        self.client().get('/artists')
+
+        with self.assertNumQueries(0):
+            res = self.client().get('/artists')
+        self.client().post('/artists/create', data={
+            'name': 'Matt Quevedo', 'city': 'New York', 'state': 'NY', 'genres': ['Jazz']})
+        page = self.client().get('/artists').data.decode()
+
+        self.assertIn('Artist 1', res.data.decode())
+        self.assertIn('Matt Quevedo', page)
+
+    def test_cache_stats(self):
+        self.add_venue('The Musical Hop')
+        db.session.commit()
+        for _ in range(4):
+            self.client().get('/venues')
+
+        res = self.client().get('/cache/stats')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['pages']['venues'], {'hits': 3, 'misses': 1, 'hit_ratio': 0.75})
+
+    def test_incomplete_cache_backend(self):
+        class GetOnlyBackend(CacheBackend):
+            def get(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            GetOnlyBackend()
+
+    """
+    2 Tests Cases for the name search
+    The first test ranks the typeahead hits, names starting with the term before names with a word starting with it
+    The second test checks that loading the name index counts against the typeahead time budget
+    """
+    def test_venue_typeahead(self):
+        for name in ('The Musical Hop', 'Hop Along', 'Shop Floor', 'Park Square'):
+            self.add_venue(name)
+        db.session.commit()
+
+        res = self.client().get('/venues/typeahead?search_term=hop')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['complete'], True)
+        self.assertEqual([hit['name'] for hit in data['data']], ['Hop Along', 'The Musical Hop', 'Shop Floor'])
+
+    def test_typeahead_budget_covers_loading(self):
+        self.add_venue('The Musical Hop')
+        db.session.commit()
+        search = NameSearch(db, Venue)
+        ensure_loaded = search.index.ensure_loaded
+
+        def slow_ensure_loaded(load, wait=True):
+            time.sleep(0.05)
+            ensure_loaded(load, wait)
+
+        search.index.ensure_loaded = slow_ensure_loaded
+        hits, complete = search.typeahead('hop', 10, 0.01)
+
+        self.assertEqual(complete, False)
+        self.assertEqual(search.typeahead('hop', 10, 1), ([(1, 'The Musical Hop')], True))
+
+    """
+    2 Tests Cases for the search pages, on the in-memory name index
+    The first test ranks the venue hits and counts the upcoming shows of each
+    The second test returns at most SEARCH_LIMIT artists, with the number of every match
+    """
+    def test_search_venues(self):
+        hop = self.add_venue('The Musical Hop')
+        for name in ('Hop Along', 'Shop Floor', 'Park Square'):
+            self.add_venue(name)
+        self.add_shows(hop, self.add_artists(2), 4)
+
+        with self.rendered() as contexts:
+            res = self.client().post('/venues/search', data={'search_term': 'HOP'})
+        results = contexts[0]['results']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(venue_search.trigram_ready())
+        self.assertEqual(results['count'], 3)
+        self.assertEqual(results['data'], [
+            {'id': 2, 'name': 'Hop Along', 'num_upcoming_shows': 0},
+            {'id': 1, 'name': 'The Musical Hop', 'num_upcoming_shows': 2},
+            {'id': 3, 'name': 'Shop Floor', 'num_upcoming_shows': 0}])
+
+    def test_search_artists_limit(self):
+        artists = self.add_artists(SEARCH_LIMIT + 5)
+        self.add_shows(self.add_venue('The Musical Hop'), artists[:1], 4)
+
+        with self.rendered() as contexts:
+            res = self.client().post('/artists/search', data={'search_term': 'artist'})
+        results = contexts[0]['results']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Number of search results for "artist": {}'.format(SEARCH_LIMIT + 5), res.data.decode())
+        self.assertEqual(results['count'], SEARCH_LIMIT + 5)
+        self.assertEqual(len(results['data']), SEARCH_LIMIT)
+        self.assertEqual(results['data'][0], {'id': 1, 'name': 'Artist 0', 'num_upcoming_shows': 2})
+        self.assertEqual(results['data'][-1]['name'], 'Artist {}'.format(SEARCH_LIMIT - 1))
+        self.assertEqual(sum(hit['num_upcoming_shows'] for hit in results['data']), 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+'''
+Adaptive quiz
+a quiz whose difficulty follows the player: two right answers in a row
+move it one level up, a wrong answer one level down (a 2-up/1-down
+staircase, it settles where the player answers about 70% right)
+    the server keeps no state, each response carries the `difficulty`
+    and `streak` the client sends back with its next request, together
+    with whether the last question was answered right
+    a question is drawn from the in-memory (category, difficulty) ids
+    of the QuestionIdPool, which applies writes in place and never reads
+    the table in a request once loaded; when the player has seen every
+    question of the level the nearest level with questions left is
+    used, and the response carries that level (with the streak reset)
+    so the next step adjusts from the difficulty actually asked
+'''
+
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+START_DIFFICULTY = 3
+STREAK_TO_LEVEL_UP = 2
+
+
+def next_level(difficulty, streak, correct):
+
+    # the (difficulty, streak) of the next question, `correct` is None
+    # before the first question
+
+    if correct is None:
+        return difficulty, streak
+    if not correct:
+        return max(difficulty - 1, MIN_DIFFICULTY), 0
+
+    streak += 1
+    if streak >= STREAK_TO_LEVEL_UP:
+        return min(difficulty + 1, MAX_DIFFICULTY), 0
+    return difficulty, streak
+
+
+def nearest_difficulties(difficulty):
+
+    # every level ordered by distance to `difficulty`, the easier one
+    # first on a tie: 3 -> 3, 2, 4, 1, 5
+
+    return sorted(range(MIN_DIFFICULTY, MAX_DIFFICULTY + 1),
+                  key=lambda level: (abs(level - difficulty),
+                                     level > difficulty))
+
+
+def pick_question(pool, category, excluded, difficulty):
+    for level in nearest_difficulties(difficulty):
+        if pool.count(category, level):
+            question = pool.pick(category, excluded, level)
+            if question is not None:
+                return question
+    return None
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import threading
+import time
+
+from models import Category, table_versions
+
+'''
+CategoryCatalog
+the formatted categories, kept in memory since they almost never change
+    get(category_id) returns one formatted category or None, formatted()
+    the list of all of them ordered by id; both are built once per load
+    and shared, callers must not modify them
+    the catalog is reloaded after any write through Category.insert/
+    update/delete in this process, and at least every `max_age` seconds
+    so writes made by other processes are picked up too
+    etag() is a strong ETag computed from the loaded categories, so an
+    ETag always stands for the same list, whichever process loaded it
+    and whatever made it change
+'''
+
+
+class CategoryCatalog:
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+
+        self.loads = 0
+
+        # (by_id, formatted, etag) of one load, replaced as a whole
+        self._loaded = ({}, [], None)
+        self._version = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def get(self, category_id):
+        self._load_if_stale()
+        return self._loaded[0].get(category_id)
+
+    def formatted(self):
+        self._load_if_stale()
+        return self._loaded[1]
+
+    def etag(self):
+        self._load_if_stale()
+        return self._loaded[2]
+
+    '''
+    formatted_with_etag()
+        the list of categories and its ETag, from the same load
+    '''
+    def formatted_with_etag(self):
+        self._load_if_stale()
+        by_id, formatted, etag = self._loaded
+        return formatted, etag
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def load(self):
+        self.invalidate()
+        self._load_if_stale()
+
+    def _load_if_stale(self):
+        version = table_versions.get(Category.__tablename__)
+        if self._is_fresh(version):
+            return
+
+        with self._lock:
+            if self._is_fresh(version):
+                return
+
+            formatted = [category.format() for category in
+                         Category.query.order_by(Category.id)]
+
+            digest = hashlib.sha1(json.dumps(
+                formatted, sort_keys=True).encode('utf-8')).hexdigest()
+            self._loaded = (
+                {category['id']: category for category in formatted},
+                formatted,
+                'categories-' + digest[:20])
+            self._version = version
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def _is_fresh(self, version):
+        return (self._version == version and
+                time.monotonic() - self._loaded_at < self.max_age)
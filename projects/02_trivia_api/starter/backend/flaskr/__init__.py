@@ -1,26 +1,55 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 import os
-from flask import Flask, request, abort, jsonify
+import click
+from flask import Flask, Response, request, abort, jsonify, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, Question, QuestionCount, \
+    Category
+from adaptive_quiz import MIN_DIFFICULTY, MAX_DIFFICULTY, \
+    START_DIFFICULTY, next_level, pick_question
+from category_catalog import CategoryCatalog
+from index_advisor import advise
+from question_bulk import FORMATS, MIMETYPES, decode_lines, \
+    export_questions, guess_format, import_questions
+from question_pool import QuestionIdPool
+from question_search import QuestionSearch
+from quiz_sessions import InMemoryQuizSessionStore
 
 QUESTIONS_PER_PAGE = 10
 
 
-def create_app(test_config=None):
+def create_app(test_config=None, quiz_sessions=None):
 
-    # create and configure the app
+    # create and configure the app, test_config may name another
+    # database with SQLALCHEMY_DATABASE_URI: the app reads and writes
+    # (indexes, question counts) the database it is created with
 
     app = Flask(__name__)
-    setup_db(app)
+    app.config.from_mapping(CATEGORY_CATALOG_MAX_AGE=300,
+                            SQLALCHEMY_DATABASE_URI=database_path)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config['SQLALCHEMY_DATABASE_URI'])
 
     CORS(app, resources={r"*": {'origins': r"*"}})
 
+    category_catalog = CategoryCatalog(
+        max_age=app.config['CATEGORY_CATALOG_MAX_AGE'])
+    with app.app_context():
+        category_catalog.load()
+        QuestionCount.ensure_built()
+
+    question_pool = QuestionIdPool()
+    question_search = QuestionSearch()
+    if quiz_sessions is None:
+        quiz_sessions = InMemoryQuizSessionStore()
+
     # CORS Headers
 
     @app.after_request
@@ -31,44 +60,74 @@ def create_app(test_config=None):
                              'GET,PUT,POST,DELETE')
         return response
 
+    def not_modified(etag):
+
+        # answers a conditional GET whose If-None-Match already holds
+        # the current ETag, before anything is loaded from the database
+
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        return None
+
     @app.route('/categories', methods=['GET'])
     def get_categories():
-        try:
-            categories = Category.query.order_by(Category.id).all()
-            formatted_categories = [category.format() for category in
-                                    categories]
+        # the ETag is the one of the catalog's current list, reloaded
+        # after a write through the models or `max_age` seconds
+        categories, etag = category_catalog.formatted_with_etag()
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
 
-            return jsonify({'success': True,
-                           'categories': formatted_categories})
+        try:
+            response = jsonify({'success': True,
+                               'categories': categories})
+            response.set_etag(etag)
+            return response
         except:
             abort(422)
 
-    def paginate_questions(request, selection):
+    def paginate_questions(request, selection, total_questions=None):
+
+        # selection is an unordered Question query, only the requested
+        # page is loaded (LIMIT/OFFSET, or keyset with ?after_id=<last id
+        # of the previous page>) and the total, unless given, comes from
+        # a COUNT
+
         try:
             page = request.args.get('page', 1, type=int)
-            start = (page - 1) * QUESTIONS_PER_PAGE
-            end = start + QUESTIONS_PER_PAGE
+            after_id = request.args.get('after_id', None, type=int)
+
+            if total_questions is None:
+                total_questions = selection.with_entities(
+                    func.count(Question.id)).scalar()
+
+            page_query = selection.order_by(Question.id)
+            if after_id is not None:
+                page_query = page_query.filter(Question.id > after_id)
+            else:
+                start = (page - 1) * QUESTIONS_PER_PAGE
+                page_query = page_query.offset(max(start, 0))
+            page_query = page_query.limit(QUESTIONS_PER_PAGE)
+
             current_questions = [question.format() for question in
-                                 selection]
-            return current_questions[start:end]
+                                 page_query]
+            return current_questions, total_questions
         except:
             abort(422)
 
     @app.route('/questions', methods=['GET'])
     def get_questions():
         try:
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, selection)
-
-            categories = Category.query.order_by(Category.id).all()
-            formatted_categories = [category.format() for category in
-                                    categories]
+            current_questions, total_questions = paginate_questions(
+                request, Question.query, QuestionCount.total())
 
             return jsonify({
                 'success': True,
-                'categories': formatted_categories,
+                'categories': category_catalog.formatted(),
                 'questions': current_questions,
-                'total_questions': len(selection),
+                'total_questions': total_questions,
                 })
         except:
             abort(422)
@@ -85,18 +144,24 @@ def create_app(test_config=None):
 
             question.delete()
 
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, selection)
+            # ?light=true skips the page and the categories and only
+            # reports the deleted id and the new total, for bulk cleanups
 
-            categories = Category.query.all()
-            formatted_categories = [category.format() for category in
-                                    categories]
+            if request.args.get('light', 'false').lower() in ('1', 'true'):
+                return jsonify({
+                    'success': True,
+                    'deleted': question_id,
+                    'total_questions': QuestionCount.total(),
+                    })
+
+            current_questions, total_questions = paginate_questions(
+                request, Question.query, QuestionCount.total())
 
             return jsonify({
                 'success': True,
-                'categories': formatted_categories,
+                'categories': category_catalog.formatted(),
                 'questions': current_questions,
-                'total_questions': len(selection),
+                'total_questions': total_questions,
                 })
         except:
 
@@ -115,14 +180,18 @@ def create_app(test_config=None):
 
         if search:
             try:
-                s = Question.query.order_by(Question.id)
-                s_ = s.filter(Question.question.ilike('%{}%'.format(search)))
-                current_questions = paginate_questions(request, s_.all())
+
+                # ranked full text search over questions and answers, the
+                # page and the total come from one pass over the index
+
+                page = request.args.get('page', 1, type=int)
+                current_questions, total_questions = question_search.search(
+                    search, page, QUESTIONS_PER_PAGE)
 
                 return jsonify(
                     {
                         'success': True, 'questions': current_questions,
-                        'total_questions': len(s_.all())
+                        'total_questions': total_questions
                     })
             except:
                 abort(422)
@@ -144,25 +213,143 @@ def create_app(test_config=None):
             except:
                 abort(422)
 
-    @app.route('/categories/<int:category_id>/questions', methods=['GET'])
-    def get_questions_by_category(category_id):
+    @app.route('/questions/stats', methods=['GET'])
+    def get_question_stats():
+
+        # read from the maintained question_counts aggregate, never from
+        # the questions table
+
         try:
-            s = Question.query.order_by(Question.id)
-            selection = s.filter(Question.category == category_id).all()
+            categories = {}
+            difficulties = {}
+            for row in QuestionCount.query.filter(QuestionCount.count > 0):
+                category = categories.setdefault(str(row.category), {
+                    'total_questions': 0, 'difficulties': {}})
+                category['total_questions'] += row.count
+                category['difficulties'][str(row.difficulty)] = row.count
+                difficulties[str(row.difficulty)] = difficulties.get(
+                    str(row.difficulty), 0) + row.count
 
-            if selection is None:
-                abort(404)
+            return jsonify({
+                'success': True,
+                'total_questions': sum(difficulties.values()),
+                'difficulties': difficulties,
+                'categories': categories,
+                })
+        except:
+            abort(422)
+
+    # Bulk import and export: the body or the response is streamed line by
+    # line, rows are inserted in batches and rejected rows are reported
+
+    def bulk_format():
+        format = request.args.get('format', None) or guess_format(
+            mimetype=request.mimetype)
+        if format not in FORMATS:
+            abort(400)
+        return format
+
+    @app.route('/questions/import', methods=['POST'])
+    def import_question_file():
+        format = bulk_format()
+
+        # the rows before an error that stopped the import are kept, the
+        # client gets the partial result with the 422
+        result = import_questions(decode_lines(request.stream), format)
+        if not result['complete']:
+            return jsonify(dict(result, success=False, error=422,
+                                message='unprocessable')), 422
+
+        return jsonify(dict(result, success=True))
+
+    @app.route('/questions/export', methods=['GET'])
+    def export_question_file():
+        format = bulk_format()
+
+        response = Response(stream_with_context(export_questions(format)),
+                            mimetype=MIMETYPES[format])
+        response.headers['Content-Disposition'] = \
+            'attachment; filename=questions.{}'.format(format)
+        return response
 
-            current_questions = paginate_questions(request, selection)
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', type=click.Choice(FORMATS), default=None,
+                  help='ndjson or csv, guessed from the file name if not set')
+    @click.option('--batch-size', default=5000, show_default=True)
+    def import_question_command(path, format, batch_size):
+        """Import questions from an NDJSON or CSV file."""
+
+        format = format or guess_format(name=path)
+        with open(path, 'rb') as file:
+            result = import_questions(decode_lines(file), format,
+                                      batch_size=batch_size)
+
+        for error in result['errors']:
+            click.echo('line {line}: {error}'.format(**error), err=True)
+        click.echo('{} questions imported, {} rejected'.format(
+            result['inserted'], result['failed']))
+        if not result['complete']:
+            raise click.ClickException('the import stopped before the end')
+
+    @app.cli.command('rebuild-question-counts')
+    def rebuild_question_counts_command():
+        """Recount questions per category and difficulty."""
+
+        QuestionCount.rebuild()
+        click.echo('{} questions counted'.format(QuestionCount.total()))
+
+    @app.cli.command('advise-indexes')
+    def advise_indexes_command():
+        """EXPLAIN the endpoint queries and flag sequential scans."""
+
+        try:
+            report = advise()
+        except ValueError as error:
+            raise click.ClickException(str(error))
+
+        flagged = 0
+        for entry in report:
+            scans = entry['sequential_scans']
+            flagged += bool(scans)
+            click.echo('{:<45} {}'.format(entry['endpoint'], (
+                'SEQUENTIAL SCAN on ' + ', '.join(scans)) if scans else 'ok'))
+            for line in entry['plan']:
+                click.echo('    ' + line)
+
+        if flagged:
+            raise click.ClickException(
+                '{} queries read a whole table'.format(flagged))
+
+    @app.cli.command('export-questions')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', type=click.Choice(FORMATS), default=None,
+                  help='ndjson or csv, guessed from the file name if not set')
+    def export_question_command(path, format):
+        """Export every question to an NDJSON or CSV file."""
+
+        format = format or guess_format(name=path)
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            for chunk in export_questions(format):
+                file.write(chunk)
 
-            cat = Category.query.filter(Category.id == category_id)
-            current_category = cat.one_or_none().format()
+    @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    def get_questions_by_category(category_id):
+        try:
+            current_category = category_catalog.get(category_id)
+            if current_category is None:
+                abort(422)
+
+            selection = Question.query.filter(
+                Question.category == category_id)
+            current_questions, total_questions = paginate_questions(
+                request, selection, QuestionCount.total(category_id))
 
             return jsonify({
                 'success': True,
                 'current_category': current_category,
                 'questions': current_questions,
-                'total_questions': len(selection),
+                'total_questions': total_questions,
                 })
         except:
 
@@ -177,15 +364,9 @@ def create_app(test_config=None):
             previous_questions = body.get('previous_questions', None)
             quiz_category = body.get('quiz_category', None)
 
-            if quiz_category != 0:
-                q = Question.query.order_by(func.random())
-                q_f = q.filter(
-                    Question.category == quiz_category, Question.id.notin_(
-                        previous_questions))
-                question = q_f.first()
-            else:
-                question = Question.query.order_by(func.random()).filter(
-                    Question.id.notin_(previous_questions)).first()
+            excluded = set(int(question_id) for question_id in
+                           previous_questions)
+            question = question_pool.pick(int(quiz_category), excluded)
 
             if question:
                 return jsonify({'success': True,
@@ -196,6 +377,93 @@ def create_app(test_config=None):
 
             abort(422)
 
+    @app.route('/quizzes/adaptive', methods=['POST'])
+    def set_adaptive_quiz():
+
+        # like /quizzes, the client also sends back the difficulty and
+        # streak of the previous response and whether it was answered
+        # right, the next question is picked at the adjusted difficulty
+
+        # validated outside the try below, which turns any error into 422
+        body = request.get_json() or {}
+        try:
+            difficulty = int(body.get('difficulty', START_DIFFICULTY))
+        except (TypeError, ValueError):
+            abort(400)
+        if not MIN_DIFFICULTY <= difficulty <= MAX_DIFFICULTY:
+            abort(400)
+
+        try:
+            previous_questions = body.get('previous_questions', [])
+            quiz_category = int(body.get('quiz_category', 0))
+            streak = int(body.get('streak', 0))
+            correct = body.get('correct', None)
+
+            difficulty, streak = next_level(difficulty, streak, correct)
+            excluded = set(int(question_id) for question_id in
+                           previous_questions)
+            question = pick_question(question_pool, quiz_category,
+                                     excluded, difficulty)
+
+            if question:
+                if question.difficulty != difficulty:
+                    # served at the nearest level with questions left,
+                    # the streak counted towards the requested one
+                    difficulty, streak = question.difficulty, 0
+                return jsonify({'success': True,
+                               'question': question.format(),
+                               'difficulty': difficulty,
+                               'streak': streak})
+
+            return jsonify({'success': True})
+        except:
+
+            abort(422)
+
+    # Quiz sessions: the server keeps the shuffled question order of a quiz,
+    # so each step is a constant time pop and the client sends no history
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+
+        try:
+            body = request.get_json()
+            quiz_category = int(body.get('quiz_category', 0))
+
+            question_ids = question_pool.ids(quiz_category)
+            session_id = quiz_sessions.create(question_ids)
+
+            return jsonify({'success': True, 'session_id': session_id,
+                           'total_questions': len(question_ids)})
+        except:
+
+            abort(422)
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+
+        try:
+            question = None
+            while question is None:
+                question_id = quiz_sessions.pop(session_id)
+                if question_id is None:
+                    return jsonify({'success': True})
+
+                # None if the question was deleted since the quiz started
+                question = Question.query.get(question_id)
+
+            return jsonify({'success': True,
+                           'question': question.format()})
+        except KeyError:
+            abort(404)
+        except:
+            abort(422)
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def delete_quiz_session(session_id):
+        quiz_sessions.delete(session_id)
+        return jsonify({'success': True, 'deleted': session_id})
+
     @app.errorhandler(404)
     def not_found(error):
         return (jsonify({'success': False, 'error': 404,
@@ -0,0 +1,135 @@
+import re
+
+from sqlalchemy import text
+
+from models import db, Question, QuestionCount
+from question_pool import ALL_CATEGORIES, pick_query
+from question_search import PostgresQuestionSearch
+
+'''
+Index advisor
+runs EXPLAIN on the queries the endpoints issue and flags the ones that
+read a whole table instead of going through an index
+    on PostgreSQL sequential scans are disabled for the EXPLAIN, so a
+    Seq Scan in the plan means no index can serve the query, even on a
+    table small enough for the planner to prefer scanning it
+    GET /questions?page=n is left out, LIMIT/OFFSET reads every row of
+    the pages it skips whatever the indexes, clients that page deep use
+    after_id
+    EXPLAIN is read on PostgreSQL and SQLite, advise() raises a
+    ValueError on any other database
+    USAGE (from the backend directory, flask variables set)
+        flask advise-indexes
+'''
+
+CATEGORY = 1
+DIFFICULTY = 3
+QUESTION_ID = 10
+EXCLUDED = [1, 2, 3]
+OFFSET = 5
+SEARCH_QUERY = 'soccer:*'
+PER_PAGE = 10
+
+
+def endpoint_queries():
+    questions = Question.query
+    by_category = Question.query.filter(Question.category == CATEGORY)
+    pick = pick_query(CATEGORY, EXCLUDED)
+    pick_by_difficulty = pick_query(CATEGORY, EXCLUDED, DIFFICULTY)
+    pick_any_category = pick_query(ALL_CATEGORIES, EXCLUDED, DIFFICULTY)
+
+    if db.engine.dialect.name == 'postgresql':
+        search = ('POST /questions search', PostgresQuestionSearch.SEARCH
+                  .bindparams(query=SEARCH_QUERY, limit=PER_PAGE, offset=0))
+    else:
+        # searched in memory, the database only reads the page
+        search = ('POST /questions search page', questions.filter(
+            Question.id.in_(list(range(QUESTION_ID, QUESTION_ID + PER_PAGE)))))
+
+    return [
+        ('GET /questions?after_id', questions.filter(
+            Question.id > QUESTION_ID).order_by(Question.id).limit(10)),
+        ('GET /categories/<id>/questions', by_category.order_by(
+            Question.id).limit(10)),
+        ('DELETE /questions/<id>', questions.filter(
+            Question.id == QUESTION_ID)),
+        ('question counts of a category', db.session.query(
+            QuestionCount.count).filter(QuestionCount.category == CATEGORY)),
+        ('POST /quizzes count', pick.with_entities(
+            db.func.count(Question.id))),
+        ('POST /quizzes pick', pick.order_by(Question.id).offset(
+            OFFSET).limit(1)),
+        ('POST /quizzes/adaptive pick', pick_by_difficulty.order_by(
+            Question.id).offset(OFFSET).limit(1)),
+        ('POST /quizzes/adaptive pick, any category',
+         pick_any_category.order_by(Question.id).offset(OFFSET).limit(1)),
+        search,
+    ]
+
+
+def explain(query):
+
+    # the plan of `query` (a Query or a text statement) as text lines
+
+    dialect = db.engine.dialect
+    statement = getattr(query, 'statement', query)
+    sql = str(statement.compile(
+        dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect.name == 'postgresql':
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+        rows = db.session.execute(text('EXPLAIN ' + sql)).fetchall()
+        db.session.rollback()
+        return [row[0] for row in rows]
+
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))
+        return [row[-1] for row in rows]
+
+    raise ValueError(unsupported_dialect(dialect.name))
+
+
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    # "SCAN t" reads the table, "SCAN t USING INDEX i" reads an index
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?(\w+)(?:\s+AS\s+\w+)?$')
+}
+
+
+def unsupported_dialect(name):
+    return ('unsupported dialect {}, the index advisor reads the plans of '
+            '{}'.format(name, ' and '.join(sorted(SEQUENTIAL_SCAN))))
+
+
+def sequential_scans(plan):
+    pattern = SEQUENTIAL_SCAN[db.engine.dialect.name]
+    tables = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match:
+            tables.append(match.group(1))
+    return tables
+
+
+'''
+advise()
+    returns one entry per endpoint query: its name, its plan and the
+    tables it scans sequentially (empty when every table is read
+    through an index)
+'''
+
+
+def advise():
+    name = db.engine.dialect.name
+    if name not in SEQUENTIAL_SCAN:
+        raise ValueError(unsupported_dialect(name))
+
+    report = []
+    for name, query in endpoint_queries():
+        plan = explain(query)
+        report.append({
+            'endpoint': name,
+            'plan': plan,
+            'sequential_scans': sequential_scans(plan)
+        })
+    return report
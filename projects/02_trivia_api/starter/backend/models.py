@@ -1,5 +1,10 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import threading
+import weakref
+from sqlalchemy import Column, String, Integer, Index, create_engine, func, \
+  inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import column_property
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -20,6 +25,179 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    create_missing_indexes()
+
+'''
+QUESTION_SEARCH_VECTOR
+the weighted tsvector the question search runs on: the question (weight
+A) and the answer (weight B), in the 'simple' configuration
+'''
+QUESTION_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(question, '')), 'A')"
+    " || setweight(to_tsvector('simple', coalesce(answer, '')), 'B')")
+
+'''
+POSTGRESQL_INDEXES
+expression indexes only PostgreSQL can build, which therefore cannot be
+declared on the models: {table: [(index name, CREATE INDEX statement)]}
+'''
+POSTGRESQL_INDEXES = {
+    'questions': [
+        ('ix_questions_search',
+         'CREATE INDEX IF NOT EXISTS ix_questions_search '
+         'ON questions USING gin ((' + QUESTION_SEARCH_VECTOR + '))'),
+    ]
+}
+
+'''
+create_missing_indexes()
+    create_all only creates missing tables, this adds the indexes
+    declared on the models, and on PostgreSQL the POSTGRESQL_INDEXES, to
+    tables that already exist (a database restored from trivia.psql)
+    it runs at start up, from setup_db, so no request waits on an index
+    build
+'''
+def create_missing_indexes():
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = set(index['name'] for index in
+                       inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as connection:
+            # expression indexes are not reflected, look them up in
+            # pg_indexes
+            existing = set(row[0] for row in connection.execute(
+                text('SELECT indexname FROM pg_indexes')))
+            for table, indexes in POSTGRESQL_INDEXES.items():
+                for name, statement in indexes:
+                    if name not in existing:
+                        connection.execute(text(statement))
+
+'''
+TableVersions
+per table write counters, bumped by the insert/update/delete methods
+of the models below, tell the in-memory caches to reload
+    !!NOTE counters are per process, writes made by another process are
+    not seen
+'''
+class TableVersions:
+  def __init__(self):
+    self._versions = {}
+    self._lock = threading.Lock()
+
+  def get(self, table):
+    return self._versions.get(table, 0)
+
+  def bump(self, table):
+    with self._lock:
+      self._versions[table] = self._versions.get(table, 0) + 1
+
+table_versions = TableVersions()
+
+'''
+QuestionWrites
+reports the questions written through Question.insert/update/delete to
+the in-memory indexes that subscribed (QuestionIdPool), right after the
+commit, so they apply the change instead of reading the table again
+    written(removed, added): (id, category, difficulty) of the question
+    before and after the write, None for an insert or a delete
+    reload(): writes that bypass the models (the bulk import), every
+    subscriber rebuilds its index
+    subscribers are held weakly, an index dropped with its app stops
+    receiving writes
+'''
+class QuestionWrites:
+  def __init__(self):
+    self._subscribers = weakref.WeakSet()
+
+  def subscribe(self, subscriber):
+    self._subscribers.add(subscriber)
+
+  def written(self, removed, added):
+    for subscriber in list(self._subscribers):
+      subscriber.question_written(removed, added)
+
+  def reload(self):
+    for subscriber in list(self._subscribers):
+      subscriber.invalidate()
+
+question_writes = QuestionWrites()
+
+'''
+QuestionCount
+the number of questions per (category, difficulty), kept current by
+Question.insert/update/delete in the same transaction as the write, so
+totals never count the questions table
+    rows that go through the models are counted; after changing questions
+    any other way (psql, a restore) run `flask rebuild-question-counts`
+'''
+class QuestionCount(db.Model):
+  __tablename__ = 'question_counts'
+
+  category = Column(Integer, primary_key=True, autoincrement=False)
+  difficulty = Column(Integer, primary_key=True, autoincrement=False)
+  count = Column(Integer, nullable=False, default=0)
+
+  '''
+  adjust(category, difficulty, delta)
+      adds `delta` to a count in the current transaction, the caller
+      commits
+  '''
+  @classmethod
+  def adjust(cls, category, difficulty, delta):
+    if not delta:
+      return
+    key = (cls.category == category) & (cls.difficulty == difficulty)
+    if cls.query.filter(key).update(
+        {cls.count: cls.count + delta}, synchronize_session=False):
+      return
+
+    # first question of this category and difficulty, another request
+    # may be inserting the same row
+    try:
+      with db.session.begin_nested():
+        db.session.add(cls(category=category, difficulty=difficulty,
+                           count=delta))
+    except IntegrityError:
+      cls.query.filter(key).update(
+        {cls.count: cls.count + delta}, synchronize_session=False)
+
+  @classmethod
+  def total(cls, category=None):
+    query = db.session.query(func.coalesce(func.sum(cls.count), 0))
+    if category is not None:
+      query = query.filter(cls.category == category)
+    return query.scalar()
+
+  '''
+  rebuild()
+      recounts every (category, difficulty) from the questions table
+  '''
+  @classmethod
+  def rebuild(cls):
+    cls.query.delete()
+    db.session.execute(cls.__table__.insert().from_select(
+      ['category', 'difficulty', 'count'],
+      db.session.query(Question.category, Question.difficulty,
+                       func.count(Question.id)).group_by(
+        Question.category, Question.difficulty)))
+    db.session.commit()
+
+  '''
+  ensure_built()
+      rebuilds the counts when they do not add up to the questions table,
+      e.g. empty or after questions were loaded with psql; a question
+      moved to another category outside the models keeps the total, run
+      `flask rebuild-question-counts` for that
+  '''
+  @classmethod
+  def ensure_built(cls):
+    if cls.total() != Question.query.count():
+      cls.rebuild()
 
 '''
 Question
@@ -27,12 +205,23 @@ Question
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (
+    # GET /categories/<id>/questions, the quiz picks of one category
+    Index('ix_questions_category_id', 'category', 'id'),
+    # quiz picks of one category and difficulty (adaptive quiz)
+    Index('ix_questions_category_difficulty_id', 'category', 'difficulty',
+          'id'),
+    # quiz picks of one difficulty in any category
+    Index('ix_questions_difficulty_id', 'difficulty', 'id'),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(Integer)
-  difficulty = Column(Integer)
+  # active_history keeps the previous value of a changed category or
+  # difficulty, update() moves the question between QuestionCount rows
+  category = column_property(Column(Integer), active_history=True)
+  difficulty = column_property(Column(Integer), active_history=True)
 
   def __init__(self, question, answer, category, difficulty):
     self.question = question
@@ -42,14 +231,41 @@ class Question(db.Model):
 
   def insert(self):
     db.session.add(self)
+    QuestionCount.adjust(self.category, self.difficulty, 1)
     db.session.commit()
+    table_versions.bump(self.__tablename__)
+    question_writes.written(None, self.key())
   
   def update(self):
+    state = inspect(self).attrs
+    category = state.category.history
+    difficulty = state.difficulty.history
+    removed = None
+    if category.deleted or difficulty.deleted:
+      removed = (self.id,
+                 category.deleted[0] if category.deleted else self.category,
+                 difficulty.deleted[0] if difficulty.deleted else self.difficulty)
+      QuestionCount.adjust(removed[1], removed[2], -1)
+      QuestionCount.adjust(self.category, self.difficulty, 1)
     db.session.commit()
+    table_versions.bump(self.__tablename__)
+    if removed:
+      question_writes.written(removed, self.key())
 
   def delete(self):
+    removed = self.key()
     db.session.delete(self)
+    QuestionCount.adjust(self.category, self.difficulty, -1)
     db.session.commit()
+    table_versions.bump(self.__tablename__)
+    question_writes.written(removed, None)
+
+  '''
+  key()
+      (id, category, difficulty), what the in-memory indexes keep
+  '''
+  def key(self):
+    return (self.id, self.category, self.difficulty)
 
   def format(self):
     return {
@@ -73,6 +289,20 @@ class Category(db.Model):
   def __init__(self, type):
     self.type = type
 
+  def insert(self):
+    db.session.add(self)
+    db.session.commit()
+    table_versions.bump(self.__tablename__)
+
+  def update(self):
+    db.session.commit()
+    table_versions.bump(self.__tablename__)
+
+  def delete(self):
+    db.session.delete(self)
+    db.session.commit()
+    table_versions.bump(self.__tablename__)
+
   def format(self):
     return {
       'id': self.id,
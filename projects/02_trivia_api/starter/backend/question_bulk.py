@@ -0,0 +1,266 @@
+import csv
+import io
+import json
+from collections import Counter
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, QuestionCount, Category, table_versions, \
+    question_writes
+
+'''
+Bulk import and export of questions
+
+Two formats are supported, one question per line:
+    ndjson  {"question": ..., "answer": ..., "category": 1, "difficulty": 2}
+    csv     a header line naming the columns, then one row per question
+An `id` column is ignored on import, so an export can be loaded into
+another database (or the same one, as copies).
+'''
+
+FORMATS = ('ndjson', 'csv')
+FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+DIFFICULTIES = range(1, 6)
+
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+def guess_format(name=None, mimetype=None):
+    for format, format_mimetype in MIMETYPES.items():
+        if mimetype == format_mimetype:
+            return format
+    if name and name.lower().endswith('.csv'):
+        return 'csv'
+    return 'ndjson'
+
+
+class UndecodableLine(str):
+
+    # stands for a line of the file that is not valid in its encoding,
+    # read_rows reports it like any other invalid row
+
+    pass
+
+
+def decode_lines(stream, encoding='utf-8-sig'):
+
+    # a binary stream (request.stream, a file opened with 'rb') as text
+    # lines, each decoded on its own as it is read, so one bad line
+    # does not stop the others
+
+    for line in stream:
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError:
+            yield UndecodableLine()
+
+
+def read_rows(lines, format):
+
+    # yields (line number, row dict) for the text lines of a file, or
+    # (line number, ValueError) for a line that cannot be parsed
+
+    if format == 'csv':
+        yield from _read_csv_rows(lines)
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, UndecodableLine):
+            yield line_number, ValueError('invalid UTF-8')
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, ValueError('invalid JSON')
+            continue
+        if not isinstance(row, dict):
+            row = ValueError('expected a JSON object')
+        yield line_number, row
+
+
+def validate_row(row, category_ids):
+
+    # the values to insert for one row, raises ValueError naming the
+    # first invalid field
+
+    values = {}
+    for field in ('question', 'answer'):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError('{} is required'.format(field))
+        values[field] = value.strip()
+
+    for field in ('category', 'difficulty'):
+        try:
+            values[field] = int(row.get(field))
+        except (TypeError, ValueError):
+            raise ValueError('{} must be an integer'.format(field))
+
+    if values['category'] not in category_ids:
+        raise ValueError('unknown category {}'.format(values['category']))
+    if values['difficulty'] not in DIFFICULTIES:
+        raise ValueError('difficulty must be between 1 and 5')
+    return values
+
+
+def _read_csv_rows(lines):
+
+    # the csv reader never sees an undecodable line, the line numbers it
+    # counts are shifted by the lines skipped before
+
+    skipped = []
+
+    def decoded():
+        for line_number, line in enumerate(lines, 1):
+            if isinstance(line, UndecodableLine):
+                skipped.append(line_number)
+            else:
+                yield line
+
+    reader = csv.DictReader(decoded())
+    reported = 0
+    for row in reader:
+        for line_number in skipped[reported:]:
+            yield line_number, ValueError('invalid UTF-8')
+        reported = len(skipped)
+        yield reader.line_num + reported, row
+    for line_number in skipped[reported:]:
+        yield line_number, ValueError('invalid UTF-8')
+
+
+'''
+import_questions(lines, format, batch_size=5000, max_errors=100)
+    validates the rows of `lines` and inserts the valid ones, one
+    transaction and one bulk INSERT per `batch_size` rows, so memory
+    stays flat and a 500k question bank is a hundred statements
+    returns {'inserted': n, 'failed': n, 'errors': [...], 'complete':
+    bool}, `errors` lists the line number and the reason of (at most
+    `max_errors` of) the rows that were not inserted
+    a batch rejected by the database is retried row by row, so only the
+    offending rows are reported and the rest of the batch is kept
+    an error that stops the import (the body cannot be read, the
+    database is gone) is not raised: the batches committed before stay,
+    `complete` is False and the last entry of `errors` names the line
+    the import stopped at
+'''
+
+
+def import_questions(lines, format, batch_size=5000, max_errors=100):
+    if format not in FORMATS:
+        raise ValueError('format must be one of {}'.format(
+            ', '.join(FORMATS)))
+
+    category_ids = set(row[0] for row in db.session.query(Category.id))
+    result = {'inserted': 0, 'failed': 0, 'errors': [], 'complete': True}
+
+    def fail(line_number, error):
+        result['failed'] += 1
+        if len(result['errors']) < max_errors:
+            result['errors'].append({'line': line_number,
+                                     'error': str(error)})
+
+    batch = []
+    line_number = 0
+    try:
+        for line_number, row in read_rows(lines, format):
+            if isinstance(row, ValueError):
+                fail(line_number, row)
+                continue
+            try:
+                batch.append((line_number, validate_row(row, category_ids)))
+            except ValueError as error:
+                fail(line_number, error)
+                continue
+
+            if len(batch) >= batch_size:
+                _insert_batch(batch, result, fail)
+                batch = []
+
+        if batch:
+            _insert_batch(batch, result, fail)
+    except Exception as error:
+        db.session.rollback()
+        result['complete'] = False
+        result['errors'].append({
+            'line': batch[0][0] if batch else line_number + 1,
+            'error': 'import stopped: {}'.format(error.__class__.__name__)})
+    finally:
+        if result['inserted']:
+            table_versions.bump(Question.__tablename__)
+            question_writes.reload()
+    return result
+
+
+def _insert_batch(batch, result, fail):
+    table = Question.__table__
+    try:
+        rows = [values for line_number, values in batch]
+        if db.engine.dialect.name == 'postgresql':
+            # a single multi-row INSERT ... VALUES, far faster than the
+            # executemany psycopg2 does by default
+            db.session.execute(table.insert().values(rows))
+        else:
+            db.session.execute(table.insert(), rows)
+        counts = Counter((values['category'], values['difficulty'])
+                         for values in rows)
+        for (category, difficulty), count in counts.items():
+            QuestionCount.adjust(category, difficulty, count)
+        db.session.commit()
+        result['inserted'] += len(batch)
+        return
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    for line_number, values in batch:
+        try:
+            db.session.execute(table.insert(), values)
+            QuestionCount.adjust(values['category'], values['difficulty'], 1)
+            db.session.commit()
+            result['inserted'] += 1
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            fail(line_number, error.__class__.__name__)
+
+
+'''
+export_questions(format, batch_size=5000)
+    yields the questions ordered by id as text chunks of `format`, read
+    `batch_size` rows at a time through a server-side cursor (yield_per
+    streams results, psycopg2 then uses a named cursor), so the export
+    never holds the table in memory
+'''
+
+
+def export_questions(format, batch_size=5000):
+    if format not in FORMATS:
+        raise ValueError('format must be one of {}'.format(
+            ', '.join(FORMATS)))
+
+    rows = db.session.query(
+        Question.id, Question.question, Question.answer,
+        Question.category, Question.difficulty).order_by(
+        Question.id).yield_per(batch_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if format == 'csv':
+        writer.writerow(FIELDS)
+
+    for count, row in enumerate(rows, 1):
+        if format == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(FIELDS, row))) + '\n')
+
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
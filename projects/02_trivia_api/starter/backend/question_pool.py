@@ -0,0 +1,284 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from array import array
+
+from flask import current_app
+
+from models import db, Question, question_writes
+
+logger = logging.getLogger(__name__)
+
+# quiz_category value meaning "any category"
+ALL_CATEGORIES = 0
+
+def pick_query(category, excluded, difficulty=None):
+
+    # the ids a pick chooses from when it falls back to the database
+
+    query = db.session.query(Question.id)
+    if category != ALL_CATEGORIES:
+        query = query.filter(Question.category == category)
+    if difficulty is not None:
+        query = query.filter(Question.difficulty == difficulty)
+    if excluded:
+        query = query.filter(Question.id.notin_(list(excluded)))
+    return query
+
+
+'''
+QuestionIdPool
+in-memory id arrays of the questions of every category, used to pick a
+random quiz question without sorting the table by random()
+    a pick draws random positions from the category's id array until it
+    finds an id that is not excluded, which takes a few tries as long
+    as most of the category is still unplayed
+    when `attempts` draws all hit excluded ids (the player is close to
+    exhausting the category) an array of at most `scan_limit` ids is
+    scanned for the ids left, a larger one falls back to the database:
+    it counts the ids left and reads the one at a random offset in id
+    order, every question left is as likely as with ORDER BY random()
+    without sorting the table
+    the ids are also kept per (category, difficulty), for quizzes that
+    ask for a given difficulty
+    the arrays are read from the table once, by the first request; then
+    every write through Question.insert/update/delete (models.
+    question_writes) is applied to them in place, the arrays stay sorted
+    by id so a write costs a binary search
+    a full rebuild (after a bulk import, and every `max_age` seconds to
+    pick up writes made by other processes) runs in a background thread,
+    requests keep using the current arrays until the new ones are swapped
+    in; the writes applied meanwhile are replayed on the new arrays
+'''
+
+
+def _insert_sorted(ids, question_id):
+    position = bisect.bisect_left(ids, question_id)
+    if position == len(ids) or ids[position] != question_id:
+        ids.insert(position, question_id)
+
+
+def _remove_sorted(ids, question_id):
+    position = bisect.bisect_left(ids, question_id)
+    if position < len(ids) and ids[position] == question_id:
+        del ids[position]
+
+
+class QuestionIdPool:
+    def __init__(self, attempts=8, scan_limit=1000, max_age=60, rng=None):
+        self.attempts = attempts
+        self.scan_limit = scan_limit
+        self.max_age = max_age
+        self.random = rng or random.Random()
+
+        self.hits = 0
+        self.scans = 0
+        self.fallbacks = 0
+        self.loads = 0
+        self.writes = 0
+
+        self._ids = {}
+        self._buckets = {}
+        self._loaded_at = None
+        self._stale = False
+        # the writes applied while a rebuild runs, None when none runs
+        self._pending = None
+        self._lock = threading.Lock()
+        question_writes.subscribe(self)
+
+    '''
+    ids(category=ALL_CATEGORIES, difficulty=None)
+        a copy of the sorted ids of `category` (and `difficulty`), the
+        pool's own arrays change with every write
+    '''
+    def ids(self, category=ALL_CATEGORIES, difficulty=None):
+        self._refresh()
+        with self._lock:
+            return array('q', self._array(category, difficulty))
+
+    def count(self, category=ALL_CATEGORIES, difficulty=None):
+        self._refresh()
+        return len(self._array(category, difficulty))
+
+    '''
+    pick(category, excluded, difficulty=None)
+        returns a random Question of `category` (ALL_CATEGORIES for any)
+        and, if given, of `difficulty`, whose id is not in the set
+        `excluded`, or None when there is none
+    '''
+    def pick(self, category, excluded, difficulty=None):
+        question_id = self.pick_id(category, excluded, difficulty)
+        if question_id is None:
+            return None
+
+        question = Question.query.get(question_id)
+        if question is None:
+            # deleted by another process since the ids were loaded
+            question_id = self._pick_id_from_db(category, excluded,
+                                                difficulty)
+            if question_id is not None:
+                question = Question.query.get(question_id)
+        return question
+
+    def pick_id(self, category, excluded, difficulty=None):
+        self._refresh()
+        with self._lock:
+            ids = self._array(category, difficulty)
+            if ids:
+                for _ in range(self.attempts):
+                    question_id = ids[self.random.randrange(len(ids))]
+                    if question_id not in excluded:
+                        self.hits += 1
+                        return question_id
+
+            if len(ids) <= self.scan_limit:
+                self.scans += 1
+                remaining = [question_id for question_id in ids
+                             if question_id not in excluded]
+                return self.random.choice(remaining) if remaining else None
+
+            self.fallbacks += 1
+        return self._pick_id_from_db(category, excluded, difficulty)
+
+    '''
+    question_written(removed, added)
+        called by models.question_writes after a write, see QuestionWrites
+    '''
+    def question_written(self, removed, added):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._apply(self._ids, self._buckets, removed, added)
+            if self._pending is not None:
+                self._pending.append((removed, added))
+            self.writes += 1
+
+    def invalidate(self):
+        # the next request starts a rebuild
+        with self._lock:
+            self._stale = True
+
+    '''
+    rebuild()
+        reads every id again and swaps the new arrays in; the requests
+        run it in a background thread, call it directly to wait for it
+    '''
+    def rebuild(self):
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+            self._stale = False
+        self._rebuild()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'scans': self.scans,
+            'fallbacks': self.fallbacks,
+            'loads': self.loads,
+            'writes': self.writes,
+            'questions': len(self._ids.get(ALL_CATEGORIES, ()))
+        }
+
+    def _array(self, category, difficulty):
+        if difficulty is None:
+            return self._ids.get(category, ())
+        return self._buckets.get((category, difficulty), ())
+
+    def _refresh(self):
+        if self._loaded_at is None:
+            # nothing to serve yet, the first request waits for the ids
+            with self._lock:
+                if self._loaded_at is None:
+                    self._ids, self._buckets = self._load()
+                    self._loaded_at = time.monotonic()
+                    self.loads += 1
+            return
+
+        if not (self._stale or
+                time.monotonic() - self._loaded_at >= self.max_age):
+            return
+        with self._lock:
+            if self._pending is not None:
+                return
+            self._pending = []
+            self._stale = False
+        app = current_app._get_current_object()
+        threading.Thread(target=self._rebuild_in, args=(app,),
+                         name='question-pool-rebuild', daemon=True).start()
+
+    def _rebuild_in(self, app):
+        with app.app_context():
+            self._rebuild()
+
+    def _rebuild(self):
+        try:
+            ids, buckets = self._load()
+        except Exception:
+            logger.exception('question ids could not be reloaded')
+            with self._lock:
+                # the current arrays are kept, retried after max_age
+                self._pending = None
+                self._loaded_at = time.monotonic()
+            return
+
+        with self._lock:
+            for removed, added in self._pending:
+                self._apply(ids, buckets, removed, added)
+            self._ids = ids
+            self._buckets = buckets
+            self._pending = None
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    @staticmethod
+    def _load():
+        ids = {ALL_CATEGORIES: array('q')}
+        buckets = {}
+        rows = db.session.query(
+            Question.id, Question.category, Question.difficulty).order_by(
+            Question.id).yield_per(10000)
+        for question_id, category, difficulty in rows:
+            ids[ALL_CATEGORIES].append(question_id)
+            ids.setdefault(category, array('q')).append(question_id)
+            for key in ((ALL_CATEGORIES, difficulty),
+                        (category, difficulty)):
+                buckets.setdefault(key, array('q')).append(question_id)
+        return ids, buckets
+
+    @staticmethod
+    def _apply(ids, buckets, removed, added):
+        # idempotent, a replayed write the rebuild already read changes
+        # nothing
+        if removed:
+            question_id, category, difficulty = removed
+            for arrays, key in ((ids, ALL_CATEGORIES), (ids, category),
+                                (buckets, (ALL_CATEGORIES, difficulty)),
+                                (buckets, (category, difficulty))):
+                if key in arrays:
+                    _remove_sorted(arrays[key], question_id)
+        if added:
+            question_id, category, difficulty = added
+            for arrays, key in ((ids, ALL_CATEGORIES), (ids, category),
+                                (buckets, (ALL_CATEGORIES, difficulty)),
+                                (buckets, (category, difficulty))):
+                _insert_sorted(arrays.setdefault(key, array('q')),
+                               question_id)
+
+    def _pick_id_from_db(self, category, excluded, difficulty=None):
+        query = pick_query(category, excluded, difficulty)
+
+        # a random position among the ids left rather than a random id
+        # value, ids after a gap in the sequence would be picked more often
+        count = query.count()
+        if not count:
+            return None
+
+        row = query.order_by(Question.id).offset(
+            self.random.randrange(count)).first()
+        if row is None:
+            # questions deleted since the count
+            row = query.order_by(Question.id.desc()).first()
+        return row[0] if row else None
@@ -0,0 +1,211 @@
+import bisect
+import re
+import threading
+import time
+
+from sqlalchemy import text
+
+from models import db, Question, QUESTION_SEARCH_VECTOR, table_versions
+
+'''
+Question search
+
+A search term is split into words and a question matches when each word
+is the start of a word of its question or of its answer ("scissor"
+finds "Edward Scissorhands"). Matches are ranked, words found in the
+question weigh more than words found in the answer, ties are broken by
+id. Both backends below follow these rules; words are compared without
+stemming, as in PostgreSQL's 'simple' text search configuration.
+
+search(term, page, per_page) returns the formatted questions of the
+requested page and the total number of matches.
+'''
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def search_words(term):
+    return [word.lower() for word in WORD.findall(term or '')]
+
+
+'''
+PostgresQuestionSearch
+full text search on the GIN index ix_questions_search over the weighted
+tsvector of the question (weight A) and the answer (weight B), created
+at start up by setup_db (models.POSTGRESQL_INDEXES)
+    the page and the total come from the same statement, the total
+    through count(*) OVER ()
+'''
+
+
+class PostgresQuestionSearch:
+    VECTOR = QUESTION_SEARCH_VECTOR
+
+    SEARCH = text(
+        'SELECT id, question, answer, category, difficulty, '
+        'count(*) OVER () AS total_questions '
+        "FROM questions, to_tsquery('simple', :query) AS query "
+        'WHERE (' + VECTOR + ') @@ query '
+        'ORDER BY ts_rank(' + VECTOR + ', query) DESC, id '
+        'LIMIT :limit OFFSET :offset')
+
+    COUNT = text(
+        'SELECT count(*) '
+        "FROM questions, to_tsquery('simple', :query) AS query "
+        'WHERE (' + VECTOR + ') @@ query')
+
+    def search(self, term, page, per_page):
+        words = search_words(term)
+        if not words:
+            return [], 0
+
+        query = ' & '.join(word + ':*' for word in words)
+        offset = max(page - 1, 0) * per_page
+        rows = db.session.execute(self.SEARCH, {
+            'query': query, 'limit': per_page, 'offset': offset}).fetchall()
+
+        if rows:
+            total_questions = rows[0]['total_questions']
+        elif offset:
+            # past the last page, the window count has no row to ride on
+            total_questions = db.session.execute(
+                self.COUNT, {'query': query}).scalar()
+        else:
+            total_questions = 0
+
+        questions = [{
+            'id': row['id'],
+            'question': row['question'],
+            'answer': row['answer'],
+            'category': row['category'],
+            'difficulty': row['difficulty']
+        } for row in rows]
+        return questions, total_questions
+
+
+'''
+InMemoryQuestionSearch
+an inverted index of the words of every question and answer, for
+databases without full text search (SQLite, the tests)
+    postings map each word to {question id: weight}, the sorted word
+    list finds every word starting with a search word by bisection
+    the index is rebuilt after any write through Question.insert/
+    update/delete in this process, and at least every `max_age` seconds
+'''
+
+
+class InMemoryQuestionSearch:
+    QUESTION_WEIGHT = 1.0
+    ANSWER_WEIGHT = 0.4
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+
+        self._postings = {}
+        self._words = []
+        self._version = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def search(self, term, page, per_page):
+        words = search_words(term)
+        if not words:
+            return [], 0
+
+        self._load_if_stale()
+        scores = None
+        for word in words:
+            matches = self._matches(word)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {question_id: score + matches[question_id]
+                          for question_id, score in scores.items()
+                          if question_id in matches}
+            if not scores:
+                return [], 0
+
+        ranked = sorted(scores, key=lambda question_id: (
+            -scores[question_id], question_id))
+        start = max(page - 1, 0) * per_page
+        page_ids = ranked[start:start + per_page]
+
+        rows = {}
+        if page_ids:
+            rows = {question.id: question for question in
+                    Question.query.filter(Question.id.in_(page_ids))}
+        questions = [rows[question_id].format() for question_id in page_ids
+                     if question_id in rows]
+        return questions, len(ranked)
+
+    def _matches(self, word):
+        matches = {}
+        position = bisect.bisect_left(self._words, word)
+        while (position < len(self._words) and
+               self._words[position].startswith(word)):
+            for question_id, weight in self._postings[
+                    self._words[position]].items():
+                # a question counts once per search word, with its best
+                # matching word
+                if weight > matches.get(question_id, 0):
+                    matches[question_id] = weight
+            position += 1
+        return matches
+
+    def _load_if_stale(self):
+        version = table_versions.get(Question.__tablename__)
+        if self._is_fresh(version):
+            return
+
+        with self._lock:
+            if self._is_fresh(version):
+                return
+
+            postings = {}
+            rows = db.session.query(
+                Question.id, Question.question, Question.answer).yield_per(
+                10000)
+            for question_id, question, answer in rows:
+                self._add(postings, question_id, question,
+                          self.QUESTION_WEIGHT)
+                self._add(postings, question_id, answer, self.ANSWER_WEIGHT)
+
+            self._postings = postings
+            self._words = sorted(postings)
+            self._version = version
+            self._loaded_at = time.monotonic()
+
+    def _is_fresh(self, version):
+        return (self._version == version and
+                time.monotonic() - self._loaded_at < self.max_age)
+
+    @staticmethod
+    def _add(postings, question_id, value, weight):
+        for word in search_words(value):
+            entry = postings.setdefault(word, {})
+            if weight > entry.get(question_id, 0):
+                entry[question_id] = weight
+
+
+'''
+QuestionSearch
+picks the search backend for the database the app is bound to, on the
+first search
+'''
+
+
+class QuestionSearch:
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            if db.engine.dialect.name == 'postgresql':
+                self._backend = PostgresQuestionSearch()
+            else:
+                self._backend = InMemoryQuestionSearch()
+        return self._backend
+
+    def search(self, term, page, per_page):
+        return self.backend.search(term, page, per_page)
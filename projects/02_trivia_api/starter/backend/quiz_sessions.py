@@ -0,0 +1,121 @@
+import random
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+'''
+QuizSessionStore
+where quiz sessions live between requests
+    a session is the shuffled order of the question ids of one quiz,
+    created once by create() and consumed one id at a time by pop(),
+    so a quiz step costs the same however long the quiz already ran
+    subclass it to keep sessions somewhere shared between processes, a
+    subclass missing one of the methods cannot be instantiated
+'''
+
+
+class QuizSessionStore(ABC):
+
+    '''
+    create(question_ids)
+        starts a session over `question_ids` and returns its id
+    '''
+    @abstractmethod
+    def create(self, question_ids):
+        pass
+
+    '''
+    pop(session_id)
+        returns the next question id of the session, or None when every
+        question was served, raises KeyError for an unknown session
+    '''
+    @abstractmethod
+    def pop(self, session_id):
+        pass
+
+    @abstractmethod
+    def delete(self, session_id):
+        pass
+
+    @staticmethod
+    def new_session_id():
+        return secrets.token_urlsafe(16)
+
+
+'''
+_LazyShuffle
+a Fisher-Yates shuffle of `ids` performed one step per pop, so creating
+a session over a million ids is as cheap as over ten
+    `ids` is never modified, the swaps are kept in `moved`
+'''
+
+
+class _LazyShuffle:
+    __slots__ = ('ids', 'remaining', 'moved', 'random')
+
+    def __init__(self, ids, rng):
+        self.ids = ids
+        self.remaining = len(ids)
+        self.moved = {}
+        self.random = rng
+
+    def pop(self):
+        if self.remaining == 0:
+            return None
+
+        last = self.remaining - 1
+        picked = self.random.randint(0, last)
+        question_id = self.moved.get(picked, self.ids[picked])
+        self.moved[picked] = self.moved.pop(last, self.ids[last])
+        self.remaining = last
+        return question_id
+
+
+'''
+InMemoryQuizSessionStore
+keeps sessions in this process
+    at most `max_sessions` are kept, the least recently used are dropped
+    first, and sessions idle for `ttl` seconds expire
+'''
+
+
+class InMemoryQuizSessionStore(QuizSessionStore):
+    def __init__(self, max_sessions=10000, ttl=3600, clock=time.monotonic,
+                 rng=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.clock = clock
+        self.random = rng or random.Random()
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, question_ids):
+        session_id = self.new_session_id()
+        with self._lock:
+            self._sessions[session_id] = (
+                self.clock(), _LazyShuffle(question_ids, self.random))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id
+
+    def pop(self, session_id):
+        with self._lock:
+            used_at, shuffle = self._sessions[session_id]
+            now = self.clock()
+            if now - used_at >= self.ttl:
+                del self._sessions[session_id]
+                raise KeyError(session_id)
+
+            self._sessions[session_id] = (now, shuffle)
+            self._sessions.move_to_end(session_id)
+            return shuffle.pop()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
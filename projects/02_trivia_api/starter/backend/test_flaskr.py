@@ -2,9 +2,13 @@ import os
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, inspect
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import Question, Category
+from index_advisor import advise
+from question_pool import QuestionIdPool
+from quiz_sessions import QuizSessionStore
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -12,11 +16,11 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = "trivia_test"
         self.database_path = "postgres://postgres:postgres@{}/{}".format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        # created on the test database, the app never binds `trivia`
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path})
+        self.client = self.app.test_client
         
         self.new_question = {
             'question': 'Is This A Test Question?',
@@ -55,7 +59,67 @@ class TriviaTestCase(unittest.TestCase):
         
         self.assertEqual(res.status_code, 405)
         self.assertEqual(data['success'], False)
-        
+
+    """
+    3 Tests Cases for the conditional get_categories
+    The first test sends back the ETag of a previous response and expects 304
+    The second test sends a stale ETag and expects the full list
+    The third test adds a category directly in the database, once reloaded the list gets a new ETag
+    """
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(res.data, b'')
+
+    def test_get_categories_with_stale_etag(self):
+        res = self.client().get('/categories', headers={'If-None-Match': '"stale"'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['categories'])
+        self.assertTrue(res.headers['ETag'])
+
+    def test_get_categories_etag_after_outside_write(self):
+        app = create_app({'CATEGORY_CATALOG_MAX_AGE': 0, 'SQLALCHEMY_DATABASE_URI': self.database_path})
+        client = app.test_client()
+        first = client.get('/categories')
+        etag = first.headers['ETag']
+
+        with app.app_context():
+            self.db.session.execute("INSERT INTO categories (type) VALUES ('Outside')")
+            self.db.session.commit()
+        try:
+            res = client.get('/categories', headers={'If-None-Match': etag})
+            data = json.loads(res.data)
+        finally:
+            with app.app_context():
+                self.db.session.execute("DELETE FROM categories WHERE type = 'Outside'")
+                self.db.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(len(data['categories']), len(json.loads(first.data)['categories']) + 1)
+
+    """
+    1 Test Case for the category catalog
+    A category inserted through the model shows up in the next response, without waiting for the catalog to expire
+    """
+    def test_get_categories_after_insert(self):
+        category = Category(type='Catalog Test')
+        category.insert()
+
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+        category_id = category.id
+        category.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn({'id': category_id, 'type': 'Catalog Test'}, data['categories'])
+
     """
     2 Tests Cases for the get_paginated_questions
     The first test for the expected behavior
@@ -82,12 +146,43 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['categories'])
         self.assertTrue(data['total_questions'])
         self.assertEqual(len(data['questions']),0)
+
+    """
+    2 Tests Cases for the keyset pagination of get_paginated_questions
+    The first test continues after the last id of the first page
+    The second test shows that an after_id beyond the last question returns an empty page
+    """
+
+    def test_get_questions_after_id(self):
+        first_page = json.loads(self.client().get('/questions').data)
+        last_id = first_page['questions'][-1]['id']
+
+        res = self.client().get('/questions?after_id={}'.format(last_id))
+        data = json.loads(res.data)
+        ids = [question['id'] for question in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+        self.assertTrue(ids)
+        self.assertEqual(ids, sorted(ids))
+        self.assertTrue(all(question_id > last_id for question_id in ids))
+
+    def test_get_questions_after_last_id(self):
+        res = self.client().get('/questions?after_id=1000000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['total_questions'])
+        self.assertEqual(len(data['questions']), 0)
      
     """
-    2 Tests Cases for the delete_question
+    3 Tests Cases for the delete_question
     The first test for the expected behavior
-    The second test for handling one kind of error (422: request unprocessable - when the question_id is not exist)
-    NOTE: the error code for second TestCase could be 404: Not Found as well
+    The second test for the light response (?light=true)
+    The third test for handling one kind of error (422: request unprocessable - when the question_id is not exist)
+    NOTE: the error code for third TestCase could be 404: Not Found as well
     """   
         
     def test_delete_question(self):
@@ -102,6 +197,21 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertEqual(question,None)
         
+    def test_delete_question_light(self):
+        question = Question(question='Delete me?', answer='Yes', difficulty=1, category=5)
+        question.insert()
+        total = Question.query.count()
+
+        res = self.client().delete('/questions/{}?light=true'.format(question.id))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['deleted'], question.id)
+        self.assertEqual(data['total_questions'], total - 1)
+        self.assertNotIn('questions', data)
+        self.assertNotIn('categories', data)
+
     def test_delete_question_if_not_exist(self):
         res = self.client().delete('/questions/2000')
         data = json.loads(res.data)
@@ -130,18 +240,50 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         
     """
-    2 Tests Cases for the search_question
+    5 Tests Cases for the search_question
     The first test for the expected behavior (with a valid searchTerm)
-    The second test shows how the response would be in case of no matches with the provided searchTerm
+        it expected 2 results when search was a substring match; since the full text search a searchTerm
+        matches the start of words, so 'title' finds question 6 but no longer 'entitled' in question 5
+    The second test finds a question by the start of a word of its answer
+    The third test ranks a match in the question ('branch') before a match in the answer ('Brazil')
+    The fourth test only finds the questions matching every word of the searchTerm
+    The fifth test shows how the response would be in case of no matches with the provided searchTerm
     """    
     def test_search_question_with_results(self):
         res = self.client().post('/questions' , json={'searchTerm':'title'})
         data = json.loads(res.data)
         
+        # search matches the start of words: 'title' no longer matches 'entitled'
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertTrue(data['questions'])
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['id'], 6)
+
+    def test_search_question_by_answer_prefix(self):
+        res = self.client().post('/questions' , json={'searchTerm':'scissor'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['answer'], 'Edward Scissorhands')
+
+    def test_search_question_ranked(self):
+        res = self.client().post('/questions' , json={'searchTerm':'bra'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
         self.assertEqual(data['total_questions'], 2)
+        self.assertEqual([question['id'] for question in data['questions']], [22, 10])
+
+    def test_search_question_all_words(self):
+        res = self.client().post('/questions' , json={'searchTerm':'soccer 1930'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 1)
+        self.assertEqual(data['questions'][0]['id'], 11)
         
     def test_search_question_with_no_results(self):
         res = self.client().post('/questions' , json={'searchTerm':'faltimah'})
@@ -151,6 +293,107 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(data['total_questions'], 0)
         
+    """
+    1 Test Case for the get_question_stats
+    The counts per category and difficulty are the COUNT(*) of the questions table, after a create,
+    a delete and an import
+    """
+    def counted_question_stats(self):
+        with self.app.app_context():
+            rows = self.db.session.query(Question.category, Question.difficulty, func.count(Question.id)).group_by(
+                Question.category, Question.difficulty).all()
+
+        categories = {}
+        difficulties = {}
+        for category, difficulty, count in rows:
+            entry = categories.setdefault(str(category), {'total_questions': 0, 'difficulties': {}})
+            entry['total_questions'] += count
+            entry['difficulties'][str(difficulty)] = count
+            difficulties[str(difficulty)] = difficulties.get(str(difficulty), 0) + count
+        return {
+            'success': True,
+            'total_questions': sum(difficulties.values()),
+            'difficulties': difficulties,
+            'categories': categories,
+        }
+
+    def test_get_question_stats(self):
+        res = self.client().get('/questions/stats')
+        before = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(before, self.counted_question_stats())
+
+        self.client().post('/questions', json=self.new_question)
+        with self.app.app_context():
+            created = Question.query.filter(Question.question == self.new_question['question']).order_by(
+                Question.id.desc()).first().id
+        after_create = json.loads(self.client().get('/questions/stats').data)
+
+        self.assertEqual(after_create, self.counted_question_stats())
+        self.assertEqual(after_create['total_questions'], before['total_questions'] + 1)
+        self.assertEqual(after_create['categories']['5']['difficulties']['1'],
+                         before['categories'].get('5', {}).get('difficulties', {}).get('1', 0) + 1)
+
+        self.client().delete('/questions/{}?light=true'.format(created))
+        after_delete = json.loads(self.client().get('/questions/stats').data)
+
+        self.assertEqual(after_delete, before)
+        self.assertEqual(after_delete, self.counted_question_stats())
+
+        body = '\n'.join([
+            json.dumps({'question': 'Counted?', 'answer': 'Yes', 'category': 1, 'difficulty': 2}),
+            json.dumps({'question': 'Counted too?', 'answer': 'Yes', 'category': 1, 'difficulty': 2}),
+            json.dumps({'question': 'Not counted?', 'answer': 'No', 'category': 1, 'difficulty': 9})])
+        self.client().post('/questions/import', data=body, content_type='application/x-ndjson')
+        after_import = json.loads(self.client().get('/questions/stats').data)
+
+        self.assertEqual(after_import, self.counted_question_stats())
+        self.assertEqual(after_import['total_questions'], before['total_questions'] + 2)
+        self.assertEqual(after_import['categories']['1']['difficulties']['2'],
+                         before['categories'].get('1', {}).get('difficulties', {}).get('2', 0) + 2)
+
+    """
+    3 Tests Cases for the bulk import and export
+    The first test imports NDJSON with one invalid row, the valid rows are inserted and the invalid one is reported
+    The second test imports a line that is not valid UTF-8, it is reported like any invalid row
+    The third test exports the questions as CSV
+    """
+    def test_import_questions(self):
+        body = '\n'.join([
+            json.dumps({'question': 'Imported?', 'answer': 'Yes', 'category': 1, 'difficulty': 2}),
+            json.dumps({'question': 'Imported too?', 'answer': 'Yes', 'category': 2, 'difficulty': 3}),
+            json.dumps({'question': 'Imported?', 'answer': 'No', 'category': 1, 'difficulty': 9})])
+        res = self.client().post('/questions/import', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['errors'][0]['line'], 3)
+
+    def test_import_questions_invalid_utf8(self):
+        rows = [json.dumps({'question': 'Decoded {}?'.format(i), 'answer': 'Yes', 'category': 1, 'difficulty': 2})
+                for i in range(5)]
+        body = '\n'.join(rows[:3]).encode() + b'\n{"question": "\xff"}\n' + '\n'.join(rows[3:]).encode()
+        res = self.client().post('/questions/import', data=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['complete'], True)
+        self.assertEqual(data['inserted'], 5)
+        self.assertEqual(data['errors'], [{'line': 4, 'error': 'invalid UTF-8'}])
+
+    def test_export_questions_csv(self):
+        res = self.client().get('/questions/export?format=csv')
+        lines = res.data.decode().splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertEqual(lines[0], 'id,question,answer,category,difficulty')
+        self.assertTrue(len(lines) > 1)
+
     """
     2 Tests Cases for the get_questions_by_category
     The first test for the expected behavior
@@ -177,9 +420,11 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'unprocessable')
      
     """
-    2 Tests Cases for the set_quiz
+    4 Tests Cases for the set_quiz
     The first test for the expected behavior
     The second test for handling one kind of error (405: method_not_allowed)
+    The third test picks from the database when the id arrays are not used
+    The fourth test checks that writes are applied to the id arrays without reading the table again
     """   
         
     def test_set_quiz(self):
@@ -197,8 +442,172 @@ class TriviaTestCase(unittest.TestCase):
         
         self.assertEqual(res.status_code, 405)
         self.assertEqual(data['success'], False)
+
+    def test_quiz_pick_from_database(self):
+        # a pool that always falls back to the database; its random draw
+        # is the position among the questions left, here the last one
+        class LastPosition:
+            def randrange(self, stop):
+                return stop - 1
+
+        pool = QuestionIdPool(attempts=0, scan_limit=0, rng=LastPosition())
+        with self.app.app_context():
+            picks = [pool.pick_id(6, set()), pool.pick_id(6, {11}), pool.pick_id(6, {10, 11})]
+
+        self.assertEqual(picks, [11, 10, None])
+        self.assertEqual(pool.stats()['fallbacks'], 3)
+
+    def test_quiz_pool_applies_writes(self):
+        pool = QuestionIdPool()
+        with self.app.app_context():
+            before = list(pool.ids(6))
+            question = Question(question='Pooled?', answer='Yes', difficulty=3, category=6)
+            question.insert()
+            question_id = question.id
+            after_insert = list(pool.ids(6))
+            in_difficulty = list(pool.ids(6, 3))
+            question.delete()
+            after_delete = list(pool.ids(6))
+
+        self.assertEqual(before, [10, 11])
+        self.assertEqual(after_insert, [10, 11, question_id])
+        self.assertEqual(in_difficulty, [10, question_id])
+        self.assertEqual(after_delete, [10, 11])
+        self.assertEqual(pool.stats()['loads'], 1)
+        self.assertEqual(pool.stats()['writes'], 2)
         
 
+    """
+    3 Tests Cases for the set_adaptive_quiz
+    The first test starts a quiz, the question is asked at the start difficulty
+    The second test sends a wrong answer, the difficulty goes one level down
+    The third test has seen every question of the difficulty, the nearest level is asked and reported
+    The fourth test for handling one kind of error (400: bad request - when the difficulty is out of range)
+    The fifth test asks a question created after the quiz started, without reading the questions again
+    """
+    def test_set_adaptive_quiz(self):
+        res = self.client().post('/quizzes/adaptive', json={'quiz_category': 0, 'previous_questions': []})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['difficulty'], 3)
+        self.assertEqual(data['streak'], 0)
+        self.assertEqual(data['question']['difficulty'], 3)
+
+    def test_set_adaptive_quiz_after_wrong_answer(self):
+        res = self.client().post('/quizzes/adaptive', json={
+            'quiz_category': 0, 'previous_questions': [], 'difficulty': 3, 'streak': 1, 'correct': False})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['difficulty'], 2)
+        self.assertEqual(data['streak'], 0)
+
+    def test_set_adaptive_quiz_nearest_difficulty(self):
+        res = self.client().post('/quizzes/adaptive', json={
+            'quiz_category': 6, 'previous_questions': [10], 'difficulty': 3, 'streak': 1, 'correct': None})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], 11)
+        self.assertEqual(data['question']['difficulty'], 4)
+        self.assertEqual(data['difficulty'], 4)
+        self.assertEqual(data['streak'], 0)
+
+    def test_set_adaptive_quiz_difficulty_out_of_range(self):
+        res = self.client().post('/quizzes/adaptive', json={
+            'quiz_category': 0, 'previous_questions': [], 'difficulty': 9})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_set_adaptive_quiz_after_write(self):
+        self.client().post('/quizzes/adaptive', json={'quiz_category': 6, 'previous_questions': []})
+        question = Question(question='Adaptive?', answer='Yes', difficulty=5, category=6)
+        question.insert()
+        question_id = question.id
+
+        res = self.client().post('/quizzes/adaptive', json={
+            'quiz_category': 6, 'previous_questions': [10, 11], 'difficulty': 5})
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], question_id)
+        self.assertEqual(data['difficulty'], 5)
+
+    """
+    3 Tests Cases for the quiz sessions
+    The first test plays a whole quiz of category 6, every question is served once and then the quiz ends
+    The second test for handling one kind of error (404: Not Found - when the session does not exist)
+    The third test checks that a session store missing a method cannot be created
+    """
+
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': 6})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], 2)
+
+        url = '/quizzes/sessions/{}/next'.format(data['session_id'])
+        served = [json.loads(self.client().post(url).data) for i in range(3)]
+
+        self.assertEqual(sorted(step['question']['id'] for step in served[:2]), [10, 11])
+        self.assertEqual(served[2], {'success': True})
+
+    def test_quiz_session_not_found(self):
+        res = self.client().post('/quizzes/sessions/not-a-session/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_incomplete_quiz_session_store(self):
+        class CreateOnlyStore(QuizSessionStore):
+            def create(self, question_ids):
+                return self.new_session_id()
+
+        with self.assertRaises(TypeError):
+            CreateOnlyStore()
+
+    """
+    3 Tests Cases for the indexes
+    The first test checks that the indexes declared on Question exist in the database
+    The second test runs the index advisor, no endpoint query may scan a whole table
+    The third test checks that the full text search index was created at start up, before any search
+    """
+
+    def test_question_indexes(self):
+        with self.app.app_context():
+            indexes = set(index['name'] for index in
+                          inspect(self.db.engine).get_indexes('questions'))
+
+        self.assertTrue(set(index.name for index in Question.__table__.indexes) <= indexes)
+        self.assertIn('ix_questions_category_id', indexes)
+
+    def test_index_advisor(self):
+        with self.app.app_context():
+            report = advise()
+
+        self.assertTrue(report)
+        self.assertIn('POST /questions search', [entry['endpoint'] for entry in report])
+        for entry in report:
+            self.assertTrue(entry['plan'])
+            self.assertEqual(entry['sequential_scans'], [], entry['endpoint'])
+
+    def test_question_search_index(self):
+        # an expression index, not reflected by the inspector
+        with self.app.app_context():
+            indexes = set(row[0] for row in self.db.session.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'questions'"))
+
+        self.assertIn('ix_questions_search', indexes)
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,85 @@
+'''
+bench_auth.py
+    micro-benchmark for token verification in src/auth/auth.py
+    signs a token with a throwaway RSA key, serves the matching public
+    key from a local jwks.json and compares verifications per second
+    with the verified-token cache on and off
+    USAGE (from the backend directory)
+        python bench_auth.py
+        python bench_auth.py --seconds 5
+'''
+import argparse
+import base64
+import json
+import os
+import tempfile
+import time
+
+from Crypto.PublicKey import RSA
+from jose import jwt
+
+from src.auth import auth
+from fsnd_auth import JWKSCache, TokenCache
+
+KID = 'bench-key'
+
+
+def b64_uint(value):
+    raw = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def make_token_and_jwks(path):
+    key = RSA.generate(2048)
+    with open(path, 'w') as f:
+        json.dump({'keys': [{
+            'kty': 'RSA',
+            'kid': KID,
+            'use': 'sig',
+            'n': b64_uint(key.n),
+            'e': b64_uint(key.e)
+        }]}, f)
+
+    claims = {
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'aud': auth.API_AUDIENCE,
+        'exp': int(time.time()) + 3600,
+        'permissions': ['get:drinks-detail', 'post:drinks']
+    }
+    return jwt.encode(claims, key.exportKey('PEM').decode('ascii'),
+                      algorithm='RS256', headers={'kid': KID})
+
+
+def run(token, seconds):
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        auth.get_verified_payload(token)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jwks_path = os.path.join(tmp, 'jwks.json')
+        token = make_token_and_jwks(jwks_path)
+        auth.verifier.jwks = JWKSCache(jwks_path)
+
+        auth.verifier.token_cache = TokenCache(maxsize=0)
+        uncached = run(token, args.seconds)
+
+        auth.verifier.token_cache = TokenCache()
+        cached = run(token, args.seconds)
+
+    print('cache off: {:>12,.0f} verifications/s'.format(uncached))
+    print('cache on:  {:>12,.0f} verifications/s'.format(cached))
+    print('speedup:   {:>12.1f}x'.format(cached / uncached))
+
+
+if __name__ == '__main__':
+    main()
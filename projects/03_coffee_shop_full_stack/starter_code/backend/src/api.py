@@ -1,15 +1,16 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, request, jsonify, abort
 from sqlalchemy import exc
-import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .database.models import db_drop_and_create_all, setup_db, Drink, \
+    drink_cache, drinks_menu, migrate_recipe_blobs
+from .auth.auth import AuthError, requires_auth, start_jwks_refresh
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app, resources={r"*": {'origins': r"*"}})
+start_jwks_refresh()
 
 # CORS Headers
 
@@ -30,6 +31,23 @@ def after_request(response):
 '''
 # db_drop_and_create_all()
 
+# moves recipes still stored as json blobs into the ingredient table
+migrate_recipe_blobs()
+
+'''
+not_modified(etag)
+    returns a 304 response when the request's If-None-Match already
+    holds `etag`, None otherwise
+'''
+
+
+def not_modified(etag):
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
 # ROUTES
 '''
 @TODO implement endpoint
@@ -39,18 +57,25 @@ def after_request(response):
         returns status code 200 and json {"success": True, "drinks": drinks}
         where drinks is the list of drinks
         or appropriate status code indicating reason for failure
+        responses carry an ETag, a request whose If-None-Match matches it
+        gets a 304 without touching the database
 '''
 
 
 @app.route('/drinks', methods=['GET'])
 def get_drinks():
+    etag = drink_cache.etag()
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
     try:
-        drinks = Drink.query.order_by(Drink.id).all()
-        formatted_drinks = [drink.short() for drink in
-                            drinks]
+        formatted_drinks = drinks_menu('short')
 
-        return jsonify({'success': True,
-                        'drinks': formatted_drinks})
+        response = jsonify({'success': True,
+                            'drinks': formatted_drinks})
+        response.set_etag(etag)
+        return response
     except:
         abort(422)
 
@@ -69,9 +94,7 @@ def get_drinks():
 @requires_auth('get:drinks-detail')
 def get_drinks_details(payload):
     try:
-        drinks = Drink.query.order_by(Drink.id).all()
-        formatted_drinks = [drink.long() for drink in
-                            drinks]
+        formatted_drinks = drinks_menu('long')
 
         return jsonify({'success': True,
                         'drinks': formatted_drinks})
@@ -104,8 +127,7 @@ def create_drink(payload):
         if None in (drink_title, drink_recipe):
             abort(400)
 
-        drink = Drink(title=drink_title,
-                      recipe=json.dumps(drink_recipe))
+        drink = Drink(title=drink_title, recipe=drink_recipe)
         drink.insert()
 
         return jsonify({'success': True, 'drinks': [drink.long()]})
@@ -143,7 +165,7 @@ def update_drink(payload, drink_id):
             drink.title = body.get('title')
 
         if 'recipe' in body:
-            drink.recipe = json.dumps(body.get('recipe'))
+            drink.recipe = body.get('recipe')
 
         drink.update()
 
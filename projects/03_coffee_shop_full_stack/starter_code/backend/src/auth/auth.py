@@ -1,96 +1,50 @@
-import json
-from flask import request, _request_ctx_stack, abort
+from flask import abort
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+
+from fsnd_auth import (AuthError, JWKSCache, PermissionRequirement,  # noqa
+                       TokenCache, TokenVerifier, check_permissions,
+                       get_token_auth_header, granted_permissions)
 
 
 AUTH0_DOMAIN = 'ifatimah.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'shop'
 
-# AuthError Exception
-'''
-AuthError Exception
-A standardized way to communicate auth failure modes
-'''
-
-
-class AuthError(Exception):
-    def __init__(self, error, status_code):
-        self.error = error
-        self.status_code = status_code
-
-
-# Auth Header
+# seconds a fetched key set is trusted before it is fetched again
+JWKS_CACHE_TTL = 600
+# minimum seconds between refetches triggered by an unknown kid
+JWKS_MIN_REFRESH_INTERVAL = 30
+# seconds to wait on Auth0 when connecting and between reads
+JWKS_CONNECT_TIMEOUT = 3
+JWKS_READ_TIMEOUT = 5
+
+# number of verified tokens remembered by requires_auth, 0 disables it
+TOKEN_CACHE_SIZE = 1024
+
+verifier = TokenVerifier(
+    AUTH0_DOMAIN, API_AUDIENCE, ALGORITHMS,
+    jwks=JWKSCache(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json',
+                   ttl=JWKS_CACHE_TTL,
+                   min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+                   connect_timeout=JWKS_CONNECT_TIMEOUT,
+                   read_timeout=JWKS_READ_TIMEOUT,
+                   stale_while_revalidate=True),
+    token_cache=TokenCache(maxsize=TOKEN_CACHE_SIZE))
 
 '''
-@TODO implement get_token_auth_header() method
-    it should attempt to get the header from the request
-        it should raise an AuthError if no header is present
-    it should attempt to split bearer and the token
-        it should raise an AuthError if the header is malformed
-    return the token part of the header
+AuthError, get_token_auth_header() and check_permissions(permission, payload)
+are implemented in fsnd_auth/core.py and shared with BasicFlaskAuth
 '''
 
-
-def get_token_auth_header():
-
-    auth = request.headers.get('Authorization', None)
-    if not auth:
-        raise AuthError({
-            'code': 'authorization_header_missing',
-            'description': 'Authorization header is expected.'
-        }, 401)
-    parts = auth.split()
-    if parts[0].lower() != 'bearer':
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'Authorization header must start with "Bearer".'
-        }, 401)
-
-    elif len(parts) == 1:
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'Token not found.'
-        }, 401)
-
-    elif len(parts) > 2:
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'Authorization header must be bearer token.'
-        }, 401)
-
-    token = parts[1]
-    return token
-
 '''
-@TODO implement check_permissions(permission, payload) method
-    @INPUTS
-        permission: string permission (i.e. 'post:drink')
-        payload: decoded jwt payload
-
-    it should raise an AuthError if permissions are not included in the payload
-        !!NOTE check your RBAC settings in Auth0
-    it should raise an AuthError if the requested permission string
-    is not in the payload permissions array
-    return true otherwise
+start_jwks_refresh()
+    prefetches the Auth0 key set and keeps it fresh from a background
+    thread, so no request waits on Auth0
 '''
 
 
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
-                        raise AuthError({
-                            'code': 'invalid_claims',
-                            'description': 'Permissions not included in JWT.'
-                        }, 400)
-
-    if permission not in payload['permissions']:
-        raise AuthError({
-            'code': 'unauthorized',
-            'description': 'Permission not found.'
-        }, 403)
-    return True
+def start_jwks_refresh():
+    verifier.jwks.start()
 
 '''
 @TODO implement verify_decode_jwt(token) method
@@ -99,6 +53,7 @@ def check_permissions(permission, payload):
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        the key set is served from verifier.jwks, not fetched per request
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
@@ -106,73 +61,38 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
-    # GET THE PUBLIC KEY FROM AUTH0
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-
-    # GET THE DATA IN THE HEADER
-    unverified_header = jwt.get_unverified_header(token)
-
-    # CHOOSE OUR KEY
-    rsa_key = {}
-    if 'kid' not in unverified_header:
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'Authorization malformed.'
-        }, 401)
-
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-            # Finally, verify!!!
-    if rsa_key:
-        try:
-            # USE THE KEY TO VALIDATE THE JWT
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
-
-            return payload
-
-        except jwt.ExpiredSignatureError:
-            raise AuthError({
-                'code': 'token_expired',
-                'description': 'Token expired.'
-            }, 401)
-
-        except jwt.JWTClaimsError:
-            raise AuthError({
-                'code': 'invalid_claims',
-                'description': 'Incorrect claims. Please, ' +
-                'check the audience and issuer.'
-            }, 401)
-        except Exception:
-            raise AuthError({
-                'code': 'invalid_header',
-                'description': 'Unable to parse authentication token.'
-            }, 400)
-    raise AuthError({
-                'code': 'invalid_header',
-                'description': 'Unable to find the appropriate key.'
-            }, 400)
+    return verifier.verify_decode_jwt(token)
+
+'''
+get_verified_token(token)
+    returns (payload, granted) for an already verified token from
+    verifier.token_cache and only runs verify_decode_jwt (and its
+    signature check) on a miss, granted is built once per verified token
+'''
+
+
+def get_verified_token(token):
+    return verifier.get_verified_token(token)
+
+
+def get_verified_payload(token):
+    return get_verified_token(token)[0]
 
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
         permission: string permission (i.e. 'post:drink')
-
+        all_of: permissions that must all be held
+        any_of: permissions of which at least one must be held
+            wildcard scopes such as '*:drinks' (any verb on drinks) or
+            'get:*' are accepted in all of them
+            EXAMPLE
+                @requires_auth(any_of=['patch:drinks', '*:drinks'])
+
+    the required permissions are compiled once, when the route is decorated
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        through get_verified_token, so repeat tokens skip the crypto
     it should use the check_permissions method validate
     claims and check the requested permission
     return the decorator which passes the decoded
@@ -180,14 +100,17 @@ def verify_decode_jwt(token):
 '''
 
 
-def requires_auth(permission=''):
+def requires_auth(permission='', all_of=None, any_of=None):
+    requirement = PermissionRequirement.compile(permission, all_of=all_of,
+                                                any_of=any_of)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             try:
                 token = get_token_auth_header()
-                payload = verify_decode_jwt(token)
-                check_permissions(permission, payload)
+                payload, granted = get_verified_token(token)
+                check_permissions(requirement, payload, granted)
             except:
                 abort(401)
             return f(payload, *args, **kwargs)
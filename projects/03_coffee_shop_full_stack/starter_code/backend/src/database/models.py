@@ -1,5 +1,8 @@
 import os
-from sqlalchemy import Column, String, Integer
+import threading
+import uuid
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Index, Text
+from sqlalchemy.orm import relationship
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -34,6 +37,148 @@ db_drop_and_create_all()
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    drink_cache.invalidate()
+
+'''
+migrate_recipe_blobs()
+    moves the json recipes stored in the legacy drink.recipe column
+    into the ingredient table and empties the column (EMPTY_RECIPE_BLOB)
+    in the same transaction, so it is safe to run on every start: a
+    recipe is moved once, and a recipe later emptied by a PATCH is not
+    brought back
+    drinks that already have ingredients (moved before the column was
+    emptied) only get their column emptied
+'''
+
+EMPTY_RECIPE_BLOB = '[]'
+
+
+def migrate_recipe_blobs():
+    db.create_all()
+    legacy = db.session.query(Drink.id, Drink.recipe_blob).filter(
+        Drink.recipe_blob != EMPTY_RECIPE_BLOB).all()
+    if not legacy:
+        return
+
+    migrated = set(row[0] for row in
+                   db.session.query(Ingredient.drink_id).distinct())
+    for drink_id, blob in legacy:
+        if drink_id in migrated:
+            continue
+        db.session.add_all(Ingredient.from_recipe(json.loads(blob),
+                                                  drink_id=drink_id))
+    db.session.query(Drink).filter(
+        Drink.id.in_([drink_id for drink_id, blob in legacy])).update(
+        {Drink.recipe_blob: EMPTY_RECIPE_BLOB}, synchronize_session=False)
+    db.session.commit()
+    drink_cache.invalidate()
+
+'''
+DrinkCache
+process-wide memo of drink representations
+    rows: the recipe and the short()/long() dicts of each drink, kept
+    per drink id
+    menus: the whole short/long drink lists served by GET /drinks and
+    GET /drinks-detail
+    every write through Drink.insert/update/delete bumps `version` and
+    drops the affected entries; a menu or a row is only stored when
+    `version` did not change since before its drinks were loaded, so
+    rows loaded before a write are never stored after it
+    etag() is a strong ETag for the current version, it includes an id
+    picked at start up so a restarted process never repeats an old one
+    !!NOTE the cache is per process, writes made by another process are
+    not seen until that process writes or restarts
+'''
+
+
+class DrinkCache:
+    def __init__(self):
+        self.boot_id = uuid.uuid4().hex[:12]
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._menus = {}
+        self._lock = threading.Lock()
+
+    def row(self, drink, version=None):
+        # `version`: self.version read before `drink` was loaded, the
+        # entry is only stored when given and still current
+        entry = self._rows.get(drink.id)
+        if entry is not None:
+            return entry
+
+        recipe = drink.recipe
+        entry = {
+            'recipe': recipe,
+            'short': {
+                'id': drink.id,
+                'title': drink.title,
+                'recipe': [{'color': r['color'], 'parts': r['parts']}
+                           for r in recipe]
+            },
+            'long': {
+                'id': drink.id,
+                'title': drink.title,
+                'recipe': recipe
+            }
+        }
+        if drink.id is not None and version is not None:
+            with self._lock:
+                if version == self.version:
+                    self._rows[drink.id] = entry
+        return entry
+
+    def menu(self, form, load):
+        menu = self._menus.get(form)
+        if menu is not None:
+            self.hits += 1
+            return menu
+
+        self.misses += 1
+        version = self.version
+        menu = [self.row(drink, version)[form] for drink in load()]
+        with self._lock:
+            if version == self.version:
+                self._menus[form] = menu
+        return menu
+
+    def invalidate(self, drink_id=None):
+        with self._lock:
+            self.version += 1
+            self._menus.clear()
+            if drink_id is None:
+                self._rows.clear()
+            else:
+                self._rows.pop(drink_id, None)
+
+    def etag(self):
+        return 'drinks-{}-{}'.format(self.boot_id, self.version)
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'rows': len(self._rows)
+        }
+
+
+drink_cache = DrinkCache()
+
+'''
+drinks_menu(form)
+    returns the list of drink.short() or drink.long() representations
+    of every drink, ordered by id, from drink_cache when no drink was
+    written since it was built
+    EXAMPLE
+        drinks_menu('short')
+'''
+
+
+def drinks_menu(form):
+    return drink_cache.menu(
+        form, lambda: Drink.query.order_by(Drink.id).all())
 
 '''
 Drink
@@ -46,35 +191,63 @@ class Drink(db.Model):
     id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
     # String Title
     title = Column(String(80), unique=True)
-    # the ingredients blob - this stores a lazy json blob
-    # the required datatype is
-    # [{'color': string, 'name':string, 'parts':number}]
-    recipe = Column(String(180), nullable=False)
+    # the recipe, one Ingredient row per part, loaded with the drink
+    # in a single joined query
+    ingredients = relationship('Ingredient', order_by='Ingredient.position',
+                               lazy='joined', cascade='all, delete-orphan')
+    # the legacy lazy json blob the recipe used to be stored in, only
+    # read by migrate_recipe_blobs(), EMPTY_RECIPE_BLOB once migrated
+    recipe_blob = Column('recipe', Text, nullable=False,
+                         default=EMPTY_RECIPE_BLOB)
+
+    '''
+    recipe
+        the recipe as a list of dicts
+        [{'color': string, 'name':string, 'parts':number}]
+        can be set from such a list, a single dict or its json string
+    '''
+    @property
+    def recipe(self):
+        return [ingredient.format() for ingredient in self.ingredients]
+
+    @recipe.setter
+    def recipe(self, recipe):
+        if isinstance(recipe, str):
+            recipe = json.loads(recipe)
+        self.ingredients = Ingredient.from_recipe(recipe)
+        # a legacy blob left behind must not replace the new recipe
+        self.recipe_blob = EMPTY_RECIPE_BLOB
+
+    '''
+    containing(name)
+        query of the drinks with an ingredient called `name`,
+        answered from the ingredient name index
+        EXAMPLE
+            Drink.containing('milk').all()
+    '''
+    @classmethod
+    def containing(cls, name):
+        return cls.query.filter(cls.id.in_(
+            db.session.query(Ingredient.drink_id).filter(
+                Ingredient.name == name))).order_by(cls.id)
 
     '''
     short()
         short form representation of the Drink model
+        from drink_cache when a menu stored it, treat the returned dict
+        as read-only
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']}
-                        for r in json.loads(self.recipe)]
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': short_recipe
-        }
+        return drink_cache.row(self)['short']
 
     '''
     long()
         long form representation of the Drink model
+        from drink_cache when a menu stored it, treat the returned dict
+        as read-only
     '''
     def long(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': json.loads(self.recipe)
-        }
+        return drink_cache.row(self)['long']
 
     '''
     insert()
@@ -88,6 +261,7 @@ class Drink(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        drink_cache.invalidate(self.id)
 
     '''
     delete()
@@ -98,8 +272,10 @@ class Drink(db.Model):
             drink.delete()
     '''
     def delete(self):
+        drink_id = self.id
         db.session.delete(self)
         db.session.commit()
+        drink_cache.invalidate(drink_id)
 
     '''
     update()
@@ -112,6 +288,50 @@ class Drink(db.Model):
     '''
     def update(self):
         db.session.commit()
+        drink_cache.invalidate(self.id)
 
     def __repr__(self):
         return json.dumps(self.short())
+
+'''
+Ingredient
+one part of a drink's recipe
+'''
+
+
+class Ingredient(db.Model):
+    __table_args__ = (
+        # answers "which drinks contain <name>" from the index alone
+        Index('ix_ingredient_name_drink_id', 'name', 'drink_id'),
+    )
+
+    id = Column(Integer().with_variant(Integer, "sqlite"), primary_key=True)
+    drink_id = Column(Integer, ForeignKey('drink.id', ondelete='CASCADE'),
+                      nullable=False, index=True)
+    # order of the ingredient within the recipe
+    position = Column(Integer, nullable=False)
+    name = Column(String(80), nullable=False)
+    color = Column(String(80), nullable=False)
+    parts = Column(Float, nullable=False)
+
+    '''
+    from_recipe(recipe)
+        builds the Ingredient rows of a recipe list (or a single dict)
+    '''
+    @classmethod
+    def from_recipe(cls, recipe, **kwargs):
+        if isinstance(recipe, dict):
+            recipe = [recipe]
+        return [cls(position=position, name=r['name'], color=r['color'],
+                    parts=r['parts'], **kwargs)
+                for position, r in enumerate(recipe)]
+
+    def format(self):
+        parts = self.parts
+        if isinstance(parts, float) and parts.is_integer():
+            parts = int(parts)
+        return {
+            'color': self.color,
+            'name': self.name,
+            'parts': parts
+        }
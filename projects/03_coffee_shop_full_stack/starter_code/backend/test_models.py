@@ -0,0 +1,153 @@
+import json
+import os
+import tempfile
+import unittest
+
+from flask import Flask
+
+from src.database.models import db, setup_db, migrate_recipe_blobs, \
+    drink_cache, drinks_menu, Drink, Ingredient
+
+LATTE = [{'name': 'espresso', 'color': 'brown', 'parts': 1},
+         {'name': 'milk', 'color': 'white', 'parts': 3}]
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """A fresh SQLite database for each test"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        setup_db(self.app)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///{}".format(
+            os.path.join(self.directory.name, "test.db"))
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        drink_cache.invalidate()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        self.directory.cleanup()
+
+
+class DrinkModelsTestCase(DatabaseTestCase):
+    """This class represents the drink models test case"""
+
+    def add_legacy_drink(self, title, recipe):
+        # a drink as stored before the ingredient table: a json blob only
+        db.session.execute(Drink.__table__.insert(), {
+            'title': title, 'recipe': json.dumps(recipe)})
+        db.session.commit()
+        return db.session.query(Drink.id).filter(
+            Drink.title == title).scalar()
+
+    def restart(self):
+        db.session.remove()
+        migrate_recipe_blobs()
+
+    def test_migrate_recipe_blobs(self):
+        drink_id = self.add_legacy_drink('latte', LATTE)
+
+        self.restart()
+        self.restart()
+
+        self.assertEqual(Drink.query.get(drink_id).recipe, LATTE)
+        self.assertEqual(Ingredient.query.count(), 2)
+
+    def test_recipe_patched_to_empty_stays_empty(self):
+        drink_id = self.add_legacy_drink('latte', LATTE)
+        self.restart()
+
+        drink = Drink.query.get(drink_id)
+        drink.recipe = []
+        drink.update()
+        self.restart()
+
+        self.assertEqual(Drink.query.get(drink_id).recipe, [])
+
+    def test_recipe_patched_after_earlier_migration(self):
+        # migrated before the blob was emptied: ingredients and blob both
+        drink_id = self.add_legacy_drink('latte', LATTE)
+        db.session.add_all(Ingredient.from_recipe(LATTE, drink_id=drink_id))
+        db.session.commit()
+
+        drink = Drink.query.get(drink_id)
+        drink.recipe = []
+        drink.update()
+        self.restart()
+
+        self.assertEqual(Drink.query.get(drink_id).recipe, [])
+
+
+class DrinkCacheTestCase(DatabaseTestCase):
+    """This class represents the drink cache test case"""
+
+    def add_drink(self, title, recipe=LATTE):
+        drink = Drink(title=title, recipe=recipe)
+        drink.insert()
+        return drink.id
+
+    def test_menu_memoized(self):
+        self.add_drink('latte')
+        self.add_drink('flat white')
+
+        first = drinks_menu('short')
+        loads = []
+        second = drink_cache.menu('short', lambda: loads.append(1) or [])
+
+        self.assertIs(first, second)
+        self.assertEqual(loads, [])
+        self.assertEqual([drink['title'] for drink in first],
+                         ['latte', 'flat white'])
+        self.assertEqual(first[0]['recipe'],
+                         [{'color': 'brown', 'parts': 1},
+                          {'color': 'white', 'parts': 3}])
+        self.assertEqual(drink_cache.stats()['hits'], 1)
+        self.assertEqual(drink_cache.stats()['rows'], 2)
+
+    def test_write_invalidates_menu_and_row(self):
+        drink_id = self.add_drink('latte')
+        other_id = self.add_drink('flat white')
+        drinks_menu('long')
+        etag = drink_cache.etag()
+        other_row = drink_cache.row(Drink.query.get(other_id))
+
+        drink = Drink.query.get(drink_id)
+        drink.title = 'iced latte'
+        drink.update()
+        menu = drinks_menu('long')
+
+        self.assertNotEqual(drink_cache.etag(), etag)
+        self.assertEqual(menu[0]['title'], 'iced latte')
+        # the other drink's row was kept
+        self.assertIs(menu[1], other_row['long'])
+
+    def test_row_loaded_before_a_write_not_stored(self):
+        drink_id = self.add_drink('latte')
+
+        def load_then_concurrent_write():
+            drinks = Drink.query.order_by(Drink.id).all()
+            # another request commits a new title and invalidates the
+            # drink while this one still holds the old row
+            db.session.execute(Drink.__table__.update().where(
+                Drink.id == drink_id).values(title='NEW'))
+            drink_cache.invalidate(drink_id)
+            return drinks
+
+        stale = drink_cache.menu('short', load_then_concurrent_write)
+        db.session.commit()
+        db.session.expire_all()
+        fresh = drinks_menu('short')
+
+        self.assertEqual(stale[0]['title'], 'latte')
+        self.assertEqual(fresh[0]['title'], 'NEW')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+from setuptools import setup
+
+'''
+fsnd_auth, the token verification shared by BasicFlaskAuth and the
+coffee shop backend, installed into their environments with
+    pip install -e <path to this directory>
+(their requirements.txt do it)
+'''
+
+setup(
+    name='fsnd-auth',
+    version='0.1.0',
+    description='Auth0 bearer token verification for the FSND Flask apps',
+    packages=['fsnd_auth'],
+    install_requires=[
+        'Flask',
+        'python-jose-cryptodome',
+    ],
+)